@@ -0,0 +1,36 @@
+"""Conan deployer used by the CMake dependency provider (conan_provider.cmake).
+
+It writes the part of the dependency graph that the results of `conan install` depend on
+to conan_graph_fingerprint.json, or conan_graph_fingerprint_<build_type>.json, in its
+output folder: the references, package_ids, settings and options of all the nodes, and the
+dependencies, generators and python_requires (with their revisions) of the root node. The
+provider compares the files of `conan install` and of `conan graph info` to tell whether
+the changes of a conanfile.py affect the install. Reading these fields from the JSON output
+of the graph in CMake would parse the whole document again for each node.
+
+Usage:
+    conan install <path> --deployer=<path to this file> -of=<output folder> ...
+    conan graph info <path> --deployer=<path to this file> ...
+"""
+import json
+import os
+
+_node_fields = ("ref", "package_id", "settings", "options")
+_root_fields = ("dependencies", "requires", "generators", "python_requires")
+
+
+def deploy(graph, output_folder, **kwargs):
+    nodes = graph.serialize()["nodes"]
+    # A list of nodes up to Conan 2.0.x, a dict keyed by their ids afterwards
+    if isinstance(nodes, dict):
+        nodes = list(nodes.values())
+    fingerprint = []
+    for index, node in enumerate(nodes):
+        fields = _node_fields + _root_fields if index == 0 else _node_fields
+        fingerprint.append({field: node.get(field) for field in fields})
+
+    build_type = graph.root.conanfile.settings.get_safe("build_type")
+    file_name = f"conan_graph_fingerprint_{build_type}.json" if build_type else "conan_graph_fingerprint.json"
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, file_name), "w") as output:
+        json.dump(fingerprint, output, indent=1, sort_keys=True, default=str)
@@ -0,0 +1,62 @@
+"""Conan deployer used by the CMake dependency provider (conan_provider.cmake).
+
+It writes the index of the packages of the dependency graph to conan_packages.cmake, or
+conan_packages_<build_type>.cmake, in the output folder of `conan install`. The provider
+includes it to set the global properties CONAN_INSTALLED_PACKAGES and
+CONAN_PACKAGE_<name>_<field>[_<CONFIG>]. Writing it from the Conan process that installs
+the packages avoids parsing the JSON output of the graph in CMake, whose cost grows with
+the number of nodes times the size of the JSON document.
+
+Usage:
+    conan install <path> --deployer=<path to this file> -of=<output folder> ...
+"""
+import os
+
+
+def _cmake_value(value):
+    if value is None:
+        value = ""
+    elif isinstance(value, (list, tuple)):
+        value = ";".join(str(v) for v in value)
+    return f"[==[{value}]==]"
+
+
+def deploy(graph, output_folder, **kwargs):
+    build_type = graph.root.conanfile.settings.get_safe("build_type")
+    suffix = build_type.upper() if build_type else ""
+
+    lines = []
+    packages = []
+    built_from_source = []
+    for node in graph.nodes:
+        if node is graph.root or node.ref is None:
+            continue
+        if node.binary == "Build":
+            built_from_source.append(str(node.ref))
+        if node.context != "host":
+            continue
+        name = node.ref.name
+        if name not in packages:
+            packages.append(name)
+        cpp_info = node.conanfile.cpp_info
+        fields = {"REF": str(node.ref),
+                  "PACKAGE_ID": node.package_id,
+                  "BINARY": node.binary,
+                  "PACKAGE_FOLDER": node.conanfile.package_folder,
+                  "INCLUDE_DIRS": cpp_info.includedirs if cpp_info is not None else None,
+                  "LIB_DIRS": cpp_info.libdirs if cpp_info is not None else None}
+        for field, value in fields.items():
+            lines.append(f"set_property(GLOBAL PROPERTY [==[CONAN_PACKAGE_{name}_{field}]==] {_cmake_value(value)})")
+            if suffix:
+                lines.append(f"set_property(GLOBAL PROPERTY [==[CONAN_PACKAGE_{name}_{field}_{suffix}]==] {_cmake_value(value)})")
+    lines.append("get_property(_packages GLOBAL PROPERTY CONAN_INSTALLED_PACKAGES)")
+    lines.append(f"list(APPEND _packages {_cmake_value(packages)})")
+    lines.append("list(REMOVE_DUPLICATES _packages)")
+    lines.append('set_property(GLOBAL PROPERTY CONAN_INSTALLED_PACKAGES "${_packages}")')
+    # Only reported after a new install, not when the index is loaded again
+    lines.append(f"set(_conan_built_from_source {_cmake_value(built_from_source)})")
+
+    file_name = f"conan_packages_{build_type}.cmake" if build_type else "conan_packages.cmake"
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, file_name), "w") as index:
+        index.write("\n".join(lines) + "\n")
@@ -0,0 +1,145 @@
+"""Conan custom command used by the CMake dependency provider (conan_provider.cmake).
+
+It runs in a single Conan process the steps that the provider would otherwise run as
+separate ones: the check of the Conan version, the detection of the default profile
+and `conan install` for each configuration, so that the startup of Python and Conan
+is only paid once. The provider copies it to the extensions/commands folder of the
+Conan home when CONAN_PROVIDER_SINGLE_PROCESS is enabled.
+
+Usage:
+    conan cmake-conan <path> [--minimum-version=VERSION] [--detect-default-profile]
+                      --install JSON_FILE [BUILD_TYPE] [--install ...] --format=json
+                      --install-args <conan install arguments>
+    conan cmake-conan <path> [--detect-default-profile] --prefetch=JSON_FILE --format=json
+                      --install-args <conan graph info arguments>
+
+The JSON output of each `conan install` is written to its JSON_FILE, in the same format
+as `conan install --format=json`. The command itself outputs the Conan version, the
+default profile and the list of installs.
+
+With --prefetch=JSON_FILE, the --install-args are those of `conan graph info` instead:
+the graph is resolved, written to JSON_FILE, and the binaries that are the same for any
+host compiler are downloaded, in the background while CMake detects the compilers
+(CONAN_PROVIDER_PREFETCH).
+"""
+import argparse
+import json
+import os
+import re
+
+from conan import __version__ as conan_version
+from conan.api.output import ConanOutput, cli_out_write
+from conan.cli.command import conan_command
+from conan.errors import ConanException
+
+
+def _version_tuple(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+def _detect_default_profile(conan_api):
+    "Detect the default profile if it doesn't exist, like `conan profile detect`"
+    profile_path = conan_api.profiles.get_path("default", os.getcwd(), exists=False)
+    if os.path.exists(profile_path):
+        return profile_path, False
+    ConanOutput().info("The default profile doesn't exist, detecting it.")
+    profile = conan_api.profiles.detect()
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    with open(profile_path, "w") as profile_file:
+        profile_file.write(profile.dumps())
+    ConanOutput().success(f"Saving detected profile to {profile_path}")
+    return profile_path, True
+
+
+def _install(conan_api, path, install_args, json_file, build_type):
+    cmd = ["install", path] + install_args
+    if build_type:
+        cmd += ["-s", f"build_type={build_type}"]
+    result = conan_api.command.run(cmd)
+    if result.get("conan_error"):
+        raise result["conan_error"]
+    os.makedirs(os.path.dirname(os.path.abspath(json_file)), exist_ok=True)
+    with open(json_file, "w") as output:
+        json.dump({"graph": result["graph"].serialize()}, output, indent=4)
+
+
+def _prefetch(conan_api, path, graph_args, json_file):
+    """Resolve the graph and download the binaries of the build context and the ones that
+    don't depend on settings, which the install with the detected host profile also uses"""
+    result = conan_api.command.run(["graph", "info", path] + graph_args)
+    graph = result["graph"].serialize()
+    os.makedirs(os.path.dirname(os.path.abspath(json_file)), exist_ok=True)
+    with open(json_file, "w") as output:
+        json.dump({"graph": graph}, output, indent=4)
+    downloads = []
+    for node in graph["nodes"].values():
+        if node["binary"] != "Download" or not node["binary_remote"]:
+            continue
+        if node["context"] == "host" and node.get("info", {}).get("settings"):
+            continue
+        pref = f"{node['ref']}:{node['package_id']}"
+        if node["prev"]:
+            pref += f"#{node['prev']}"
+        conan_api.command.run(["download", pref, "-r", node["binary_remote"]])
+        downloads.append(pref)
+    return downloads
+
+
+def _format_json(result):
+    cli_out_write(json.dumps(result, indent=4))
+
+
+@conan_command(group="Consumer", formatters={"json": _format_json})
+def cmake_conan(conan_api, parser, *args):
+    """
+    Check the Conan version, detect the default profile and install the requirements of
+    a conanfile for several configurations, for the CMake dependency provider.
+    """
+    parser.add_argument("path", help="Path to the conanfile")
+    parser.add_argument("--minimum-version", help="Fail if Conan is older than this version")
+    parser.add_argument("--detect-default-profile", action="store_true",
+                        help="Detect the default profile if it doesn't exist")
+    parser.add_argument("--install", nargs="+", action="append", default=[],
+                        help="JSON file the graph is written to, and optionally the build_type "
+                             "installed. It can be given several times")
+    parser.add_argument("--prefetch", metavar="JSON_FILE",
+                        help="Resolve the graph into this file and download the binaries "
+                             "that don't depend on the host settings, instead of installing")
+    parser.add_argument("--install-args", nargs=argparse.REMAINDER, default=[],
+                        help="Arguments of conan install, for all the installs "
+                             "(of conan graph info, with --prefetch)")
+    args = parser.parse_args(*args)
+
+    if args.minimum_version and _version_tuple(conan_version) < _version_tuple(args.minimum_version):
+        raise ConanException(f"CMake-Conan: Conan version must be {args.minimum_version} or later")
+    # The installs run through ConanAPI.command, added in Conan 2.2.0
+    if _version_tuple(conan_version) < (2, 2, 0):
+        raise ConanException(f"CMake-Conan: the cmake-conan command requires Conan 2.2.0 or later, "
+                             f"found {conan_version}")
+
+    default_profile, detected = None, False
+    if args.detect_default_profile:
+        default_profile, detected = _detect_default_profile(conan_api)
+
+    if args.prefetch:
+        if args.install:
+            raise ConanException("--prefetch and --install can't be used together")
+        downloads = _prefetch(conan_api, args.path, args.install_args, args.prefetch)
+        return {"conan_version": str(conan_version),
+                "default_profile": default_profile,
+                "default_profile_detected": detected,
+                "prefetch": {"graph_file": args.prefetch, "downloads": downloads}}
+
+    installs = []
+    for install in args.install:
+        if len(install) > 2:
+            raise ConanException(f"--install takes a JSON file and a build_type, got: {' '.join(install)}")
+        json_file = install[0]
+        build_type = install[1] if len(install) > 1 else None
+        _install(conan_api, args.path, args.install_args, json_file, build_type)
+        installs.append({"json_file": json_file, "build_type": build_type})
+
+    return {"conan_version": str(conan_version),
+            "default_profile": default_profile,
+            "default_profile_detected": detected,
+            "installs": installs}
@@ -0,0 +1,84 @@
+"""Configure several CMake presets in parallel with the Conan dependency provider.
+
+The configures share the results of `conan install` through the shared cache of
+the provider (CONAN_PROVIDER_SHARED_CACHE), so presets whose Conan inputs are the
+same (profiles, conanfile, lockfile) install their dependencies only once: the
+first one installs, and the others wait for it and reuse the result. The installs of
+presets with different inputs but the same profiles run one at a time, as they may build
+the same binaries into the Conan cache, while the rest of the configures runs in parallel.
+
+Usage:
+    python conan_configure_presets.py [--source-dir DIR] [--jobs N] [--shared-cache DIR]
+                                      [preset ...] [-- cmake arguments]
+
+Without presets, all the configure presets of the project are configured.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+conan_provider = Path(__file__).resolve().parent / "conan_provider.cmake"
+
+
+def list_presets(source_dir):
+    output = subprocess.run(["cmake", "--list-presets=configure"], cwd=source_dir, check=True,
+                            capture_output=True, text=True).stdout
+    return re.findall(r'^\s+"([^"]+)"', output, re.MULTILINE)
+
+
+def detect_default_profile(conan):
+    # Done once up front, as concurrent configures would all try to detect it
+    if subprocess.run([conan, "profile", "path", "default"], capture_output=True).returncode != 0:
+        subprocess.run([conan, "profile", "detect"], check=True)
+
+
+def configure(preset, source_dir, shared_cache, cmake_args):
+    cmd = ["cmake", "--preset", preset,
+           f"-DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider.as_posix()}",
+           f"-DCONAN_PROVIDER_SHARED_CACHE={shared_cache.as_posix()}"] + cmake_args
+    result = subprocess.run(cmd, cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return result.returncode, result.stdout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Configure CMake presets in parallel, "
+                                                 "sharing their Conan installs")
+    parser.add_argument("presets", nargs="*", help="configure presets (default: all of them)")
+    parser.add_argument("--source-dir", default=".", help="folder of the CMakePresets.json file")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                        help="maximum number of configures running at the same time")
+    parser.add_argument("--shared-cache", help="CONAN_PROVIDER_SHARED_CACHE folder "
+                                               "(default: conan_shared_cache in the source folder)")
+    parser.add_argument("--conan", default=os.environ.get("CONAN_COMMAND", "conan"),
+                        help="Conan executable used to detect the default profile")
+    args, cmake_args = parser.parse_known_args(argv)
+    cmake_args = [arg for arg in cmake_args if arg != "--"]
+
+    source_dir = Path(args.source_dir).resolve()
+    shared_cache = Path(args.shared_cache).resolve() if args.shared_cache else source_dir / "conan_shared_cache"
+    presets = args.presets or list_presets(source_dir)
+    if not presets:
+        parser.error(f"no configure presets found in {source_dir}")
+
+    detect_default_profile(args.conan)
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {preset: pool.submit(configure, preset, source_dir, shared_cache, cmake_args) for preset in presets}
+        for preset, future in futures.items():
+            returncode, output = future.result()
+            print(f"===== {preset}: {'done' if returncode == 0 else 'FAILED'} =====")
+            print(output, flush=True)
+            if returncode != 0:
+                failed.append(preset)
+    if failed:
+        print(f"Configure failed for preset(s): {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,23 @@
 set(CONAN_MINIMUM_VERSION 2.0.5)
 
 
+function(conan_timer_start phase)
+    string(TIMESTAMP _now "%s%f")
+    set_property(GLOBAL PROPERTY CONAN_TIMER_START_${phase} ${_now})
+endfunction()
+
+
+function(conan_timer_stop phase)
+    # Record the wall-clock time of a phase, in microseconds
+    get_property(_start GLOBAL PROPERTY CONAN_TIMER_START_${phase})
+    get_property(_provider_start GLOBAL PROPERTY CONAN_PROVIDER_START_TIME)
+    string(TIMESTAMP _now "%s%f")
+    math(EXPR _offset "${_start} - ${_provider_start}")
+    math(EXPR _duration "${_now} - ${_start}")
+    set_property(GLOBAL APPEND PROPERTY CONAN_PROVIDER_TIMINGS "${phase}|${_offset}|${_duration}")
+endfunction()
+
+
 function(detect_os OS OS_API_LEVEL OS_SDK OS_SUBSYSTEM OS_VERSION)
     # it could be cross compilation
     message(STATUS "CMake-Conan: cmake_system_name=${CMAKE_SYSTEM_NAME}")
@@ -103,18 +120,22 @@ endfunction()
 
 macro(detect_gnu_libstdcxx)
     # _CONAN_IS_GNU_LIBSTDCXX true if GNU libstdc++
+    conan_timer_start("check_cxx_source_compiles(_CONAN_IS_GNU_LIBSTDCXX)")
     check_cxx_source_compiles("
     #include <cstddef>
     #if !defined(__GLIBCXX__) && !defined(__GLIBCPP__)
     static_assert(false);
     #endif
     int main(){}" _CONAN_IS_GNU_LIBSTDCXX)
+    conan_timer_stop("check_cxx_source_compiles(_CONAN_IS_GNU_LIBSTDCXX)")
 
     # _CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI true if C++11 ABI
+    conan_timer_start("check_cxx_source_compiles(_CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI)")
     check_cxx_source_compiles("
     #include <string>
     static_assert(sizeof(std::string) != sizeof(void*), \"using libstdc++\");
     int main () {}" _CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI)
+    conan_timer_stop("check_cxx_source_compiles(_CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI)")
 
     set(_CONAN_GNU_LIBSTDCXX_SUFFIX "")
     if(_CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI)
@@ -126,12 +147,14 @@ endmacro()
 
 macro(detect_libcxx)
     # _CONAN_IS_LIBCXX true if LLVM libc++
+    conan_timer_start("check_cxx_source_compiles(_CONAN_IS_LIBCXX)")
     check_cxx_source_compiles("
     #include <cstddef>
     #if !defined(_LIBCPP_VERSION)
        static_assert(false);
     #endif
     int main(){}" _CONAN_IS_LIBCXX)
+    conan_timer_stop("check_cxx_source_compiles(_CONAN_IS_LIBCXX)")
 endmacro()
 
 
@@ -312,12 +335,105 @@ macro(append_compiler_executables_configuration)
 endmacro()
 
 
+macro(append_build_parallelism_configuration)
+    # Dependencies built from source use the same number of jobs as the consumer build
+    if("$ENV{CMAKE_BUILD_PARALLEL_LEVEL}" MATCHES "^[1-9][0-9]*$")
+        string(APPEND PROFILE "tools.build:jobs=$ENV{CMAKE_BUILD_PARALLEL_LEVEL}\n")
+    endif()
+    # and the compiler launchers (e.g. ccache) and other CONAN_TOOLCHAIN_VARIABLES,
+    # through the toolchain generated by CMakeToolchain (Conan 2.4.0 or later)
+    set(_conan_extra_variables "")
+    foreach(_conan_variable IN LISTS CONAN_TOOLCHAIN_VARIABLES)
+        if(NOT "${${_conan_variable}}" STREQUAL "")
+            if(_conan_extra_variables)
+                string(APPEND _conan_extra_variables ",")
+            endif()
+            # Escaped as a JSON string on a single line
+            set(_conan_value "${${_conan_variable}}")
+            string(REPLACE "\\" "\\\\" _conan_value "${_conan_value}")
+            string(REPLACE "\"" "\\\"" _conan_value "${_conan_value}")
+            string(REPLACE "\n" "\\n" _conan_value "${_conan_value}")
+            string(REPLACE "\r" "\\r" _conan_value "${_conan_value}")
+            string(REPLACE "\t" "\\t" _conan_value "${_conan_value}")
+            string(APPEND _conan_extra_variables "\"${_conan_variable}\":\"${_conan_value}\"")
+        endif()
+    endforeach()
+    # The version may not be known yet in single process mode
+    set(_conan_toolchain_version "${CONAN_CURRENT_VERSION}")
+    if(_conan_extra_variables AND NOT _conan_toolchain_version AND NOT CONAN_SKIP_VERSION_CHECK)
+        conan_get_version(${CONAN_COMMAND} _conan_toolchain_version)
+    endif()
+    if(_conan_extra_variables AND _conan_toolchain_version AND _conan_toolchain_version VERSION_GREATER_EQUAL 2.4.0)
+        string(APPEND PROFILE "tools.cmake.cmaketoolchain:extra_variables={${_conan_extra_variables}}\n")
+    elseif(_conan_extra_variables AND _conan_toolchain_version)
+        message(STATUS "CMake-Conan: Conan ${_conan_toolchain_version} does not support "
+                       "tools.cmake.cmaketoolchain:extra_variables, CONAN_TOOLCHAIN_VARIABLES are ignored")
+    elseif(_conan_extra_variables)
+        message(STATUS "CMake-Conan: the Conan version is not known with CONAN_SKIP_VERSION_CHECK, "
+                       "CONAN_TOOLCHAIN_VARIABLES are ignored")
+    endif()
+    unset(_conan_extra_variables)
+    unset(_conan_toolchain_version)
+    unset(_conan_value)
+    unset(_conan_variable)
+endmacro()
+
+
+function(detect_settings_key output_variable)
+    # Everything the detection of the settings depends on, including this file
+    file(SHA256 "${CMAKE_CURRENT_FUNCTION_LIST_FILE}" _provider_hash)
+    set(_key_input "${_provider_hash}")
+    foreach(_var IN ITEMS CMAKE_SYSTEM_NAME CMAKE_SYSTEM_PROCESSOR CMAKE_SYSTEM_VERSION CMAKE_SYSROOT
+                          CMAKE_TOOLCHAIN_FILE CMAKE_OSX_SYSROOT CMAKE_OSX_ARCHITECTURES CMAKE_OSX_DEPLOYMENT_TARGET
+                          ANDROID_PLATFORM CMAKE_ANDROID_STL_TYPE MSVC_VERSION CMAKE_MSVC_RUNTIME_LIBRARY
+                          CMAKE_C_COMPILER CMAKE_C_COMPILER_ID CMAKE_C_COMPILER_VERSION
+                          CMAKE_CXX_COMPILER CMAKE_CXX_COMPILER_ID CMAKE_CXX_COMPILER_VERSION
+                          CMAKE_CXX_COMPILER_ARCHITECTURE_ID CMAKE_CXX_COMPILER_TARGET
+                          CMAKE_CXX_STANDARD CMAKE_CXX_EXTENSIONS CMAKE_CXX_FLAGS)
+        string(APPEND _key_input "\n${_var}=${${_var}}")
+    endforeach()
+    string(SHA256 _key "${_key_input}")
+    set(${output_variable} ${_key} PARENT_SCOPE)
+endfunction()
+
+
 function(detect_host_profile output_file)
-    detect_os(MYOS MYOS_API_LEVEL MYOS_SDK MYOS_SUBSYSTEM MYOS_VERSION)
-    detect_arch(MYARCH)
-    detect_compiler(MYCOMPILER MYCOMPILER_VERSION MYCOMPILER_RUNTIME MYCOMPILER_RUNTIME_TYPE)
-    detect_cxx_standard(MYCXX_STANDARD)
-    detect_lib_cxx(MYLIB_CXX)
+    # The detected settings are stored in the CMake cache, and are only detected
+    # again when the toolchain or any of the other inputs of the detection change
+    set(_detected_settings MYOS MYOS_API_LEVEL MYOS_SDK MYOS_SUBSYSTEM MYOS_VERSION MYARCH
+                           MYCOMPILER MYCOMPILER_VERSION MYCOMPILER_RUNTIME MYCOMPILER_RUNTIME_TYPE
+                           MYCXX_STANDARD MYLIB_CXX)
+    detect_settings_key(_detected_settings_key)
+    if("${_detected_settings_key}" STREQUAL "${CONAN_DETECTED_SETTINGS_KEY}")
+        message(STATUS "CMake-Conan: Reusing settings detected in a previous run")
+        foreach(_setting IN LISTS _detected_settings)
+            set(${_setting} "${CONAN_DETECTED_${_setting}}")
+        endforeach()
+    else()
+        # Results of check_cxx_source_compiles() are cached too, discard them
+        unset(_CONAN_IS_GNU_LIBSTDCXX CACHE)
+        unset(_CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI CACHE)
+        unset(_CONAN_IS_LIBCXX CACHE)
+        conan_timer_start(detect_os)
+        detect_os(MYOS MYOS_API_LEVEL MYOS_SDK MYOS_SUBSYSTEM MYOS_VERSION)
+        conan_timer_stop(detect_os)
+        conan_timer_start(detect_arch)
+        detect_arch(MYARCH)
+        conan_timer_stop(detect_arch)
+        conan_timer_start(detect_compiler)
+        detect_compiler(MYCOMPILER MYCOMPILER_VERSION MYCOMPILER_RUNTIME MYCOMPILER_RUNTIME_TYPE)
+        conan_timer_stop(detect_compiler)
+        conan_timer_start(detect_cxx_standard)
+        detect_cxx_standard(MYCXX_STANDARD)
+        conan_timer_stop(detect_cxx_standard)
+        conan_timer_start(detect_lib_cxx)
+        detect_lib_cxx(MYLIB_CXX)
+        conan_timer_stop(detect_lib_cxx)
+        foreach(_setting IN LISTS _detected_settings)
+            set(CONAN_DETECTED_${_setting} "${${_setting}}" CACHE INTERNAL "Setting detected by CMake-Conan")
+        endforeach()
+        set(CONAN_DETECTED_SETTINGS_KEY "${_detected_settings_key}" CACHE INTERNAL "Inputs of the CMake-Conan settings detection")
+    endif()
     detect_build_type(MYBUILD_TYPE)
 
     set(PROFILE "")
@@ -373,13 +489,25 @@ function(detect_host_profile output_file)
 
     # propagate compilers via profile
     append_compiler_executables_configuration()
+    append_build_parallelism_configuration()
 
     if(MYOS STREQUAL "Android")
         string(APPEND PROFILE "tools.android:ndk_path=${CMAKE_ANDROID_NDK}\n")
     endif()
 
-    message(STATUS "CMake-Conan: Creating profile ${_FN}")
-    file(WRITE ${_FN} ${PROFILE})
+    # Only write the profile when its contents change, to preserve its timestamp
+    string(SHA256 _profile_hash "${PROFILE}")
+    set_property(GLOBAL PROPERTY CONAN_HOST_PROFILE_HASH ${_profile_hash})
+    set(_previous_profile "")
+    if(EXISTS ${_FN})
+        file(READ ${_FN} _previous_profile)
+    endif()
+    if("${_previous_profile}" STREQUAL "${PROFILE}")
+        message(STATUS "CMake-Conan: Profile ${_FN} is up to date")
+    else()
+        message(STATUS "CMake-Conan: Creating profile ${_FN}")
+        file(WRITE ${_FN} "${PROFILE}")
+    endif()
     message(STATUS "CMake-Conan: Profile: \n${PROFILE}")
 endfunction()
 
@@ -406,12 +534,43 @@ function(conan_profile_detect_default)
 endfunction()
 
 
+function(conan_offline_install_args output_variable)
+    # Arguments of a `conan install` that does not use the remotes. In AUTO mode, missing
+    # binaries are not built either, so that anything not in the cache is reported instead
+    set(_args ${ARGN})
+    if(CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+        list(FILTER _args EXCLUDE REGEX "^--build=missing")
+    endif()
+    list(APPEND _args --no-remote)
+    set(${output_variable} ${_args} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_missing_packages conan_output result_variable)
+    # Whether a failed `conan install` reported recipes or binaries missing from the cache
+    if("${conan_output}" MATCHES "not resolved|could not be resolved|Unable to find|Missing prebuilt package|Missing binary")
+        set(${result_variable} TRUE PARENT_SCOPE)
+    else()
+        set(${result_variable} FALSE PARENT_SCOPE)
+    endif()
+endfunction()
+
+
 function(conan_install)
-    cmake_parse_arguments(ARGS CONAN_ARGS ${ARGN})
+    # Invoke "conan install" for CONANFILE (default: the top-level source directory)
+    # into OUTPUT_FOLDER (default: ${CMAKE_BINARY_DIR}/conan)
+    cmake_parse_arguments(ARGS "" "CONANFILE;OUTPUT_FOLDER" "" ${ARGN})
+    set(_conanfile_path ${CMAKE_SOURCE_DIR})
+    if(ARGS_CONANFILE)
+        set(_conanfile_path ${ARGS_CONANFILE})
+    endif()
     set(CONAN_OUTPUT_FOLDER ${CMAKE_BINARY_DIR}/conan)
+    if(ARGS_OUTPUT_FOLDER)
+        set(CONAN_OUTPUT_FOLDER ${ARGS_OUTPUT_FOLDER})
+    endif()
     # Invoke "conan install" with the provided arguments
-    set(CONAN_ARGS ${CONAN_ARGS} -of=${CONAN_OUTPUT_FOLDER})
-    message(STATUS "CMake-Conan: conan install ${CMAKE_SOURCE_DIR} ${CONAN_ARGS} ${ARGN}")
+    conan_install_deployers(_deployer_args)
+    set(CONAN_ARGS ${CONAN_ARGS} -of=${CONAN_OUTPUT_FOLDER} ${_deployer_args})
 
 
     # In case there was not a valid cmake executable in the PATH, we inject the
@@ -421,12 +580,52 @@ function(conan_install)
         set(ENV{PATH} "$ENV{PATH}:${PATH_TO_CMAKE_BIN}")
     endif()
 
-    execute_process(COMMAND ${CONAN_COMMAND} install ${CMAKE_SOURCE_DIR} ${CONAN_ARGS} ${ARGN} --format=json
-                    RESULT_VARIABLE return_code
-                    OUTPUT_VARIABLE conan_stdout
-                    ERROR_VARIABLE conan_stderr
-                    ECHO_ERROR_VARIABLE    # show the text output regardless
-                    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR})
+    set(_config "${CMAKE_BUILD_TYPE}")
+    if("${ARGS_UNPARSED_ARGUMENTS}" MATCHES "build_type=([^;]+)")
+        set(_config "${CMAKE_MATCH_1}")
+    endif()
+    set(_timer_phase "conan_install(${_config})")
+    # The JSON output goes to a file, which is only parsed for the fields that are needed.
+    # The text output of Conan, e.g. the progress of the packages built from source,
+    # is shown while it runs.
+    set(_json_file "${CONAN_OUTPUT_FOLDER}/conan_install.json")
+    if(_config)
+        set(_json_file "${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.json")
+    endif()
+    file(MAKE_DIRECTORY "${CONAN_OUTPUT_FOLDER}")
+    # In offline mode the remotes are not used. In AUTO mode, they are only used
+    # if the first attempt without them reports packages missing from the cache
+    set(_attempts ONLINE)
+    if(CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+        set(_attempts OFFLINE ONLINE)
+    elseif(CONAN_PROVIDER_OFFLINE)
+        set(_attempts OFFLINE)
+    endif()
+    foreach(_attempt IN LISTS _attempts)
+        set(_conan_args ${ARGS_UNPARSED_ARGUMENTS})
+        if(_attempt STREQUAL "OFFLINE")
+            conan_offline_install_args(_conan_args ${_conan_args})
+        endif()
+        message(STATUS "CMake-Conan: conan install ${_conanfile_path} ${CONAN_ARGS} ${_conan_args}")
+        conan_timer_start(${_timer_phase})
+        execute_process(COMMAND ${CONAN_COMMAND} install ${_conanfile_path} ${CONAN_ARGS} ${_conan_args} --format=json
+                        RESULT_VARIABLE return_code
+                        OUTPUT_FILE "${_json_file}"
+                        ERROR_VARIABLE conan_stderr
+                        ECHO_ERROR_VARIABLE    # show the text output regardless
+                        WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR})
+        conan_timer_stop(${_timer_phase})
+        if(_attempt STREQUAL "OFFLINE" AND "${return_code}" STREQUAL "0")
+            message(STATUS "CMake-Conan: all packages found in the Conan cache, remotes were not used")
+            break()
+        elseif(_attempt STREQUAL "OFFLINE" AND "ONLINE" IN_LIST _attempts)
+            conan_install_missing_packages("${conan_stderr}" _missing_packages)
+            if(NOT _missing_packages)
+                break()
+            endif()
+            message(STATUS "CMake-Conan: packages missing from the Conan cache, installing with remotes")
+        endif()
+    endforeach()
 
     if(DEFINED PATH_TO_CMAKE_BIN)
         set(ENV{PATH} "${_OLD_PATH}")
@@ -436,25 +635,303 @@ function(conan_install)
         message(FATAL_ERROR "Conan install failed='${return_code}'")
     endif()
 
+    conan_parse_install_output("${_json_file}" ${CONAN_OUTPUT_FOLDER})
+endfunction()
+
+
+function(conan_parse_install_output json_file output_folder)
+    conan_timer_start(conan_parse_install_output)
+    # Each string(JSON) call parses the whole document, only the fields
+    # of the root node that are needed are read
+    file(READ "${json_file}" _json)
     # the files are generated in a folder that depends on the layout used, if
     # one is specified, but we don't know a priori where this is.
     # TODO: this can be made more robust if Conan can provide this in the json output
-    string(JSON CONAN_GENERATORS_FOLDER GET ${conan_stdout} graph nodes 0 generators_folder)
+    string(JSON CONAN_GENERATORS_FOLDER GET "${_json}" graph nodes 0 generators_folder)
     cmake_path(CONVERT ${CONAN_GENERATORS_FOLDER} TO_CMAKE_PATH_LIST CONAN_GENERATORS_FOLDER)
-    # message("conan stdout: ${conan_stdout}")
     message(STATUS "CMake-Conan: CONAN_GENERATORS_FOLDER=${CONAN_GENERATORS_FOLDER}")
     set_property(GLOBAL PROPERTY CONAN_GENERATORS_FOLDER "${CONAN_GENERATORS_FOLDER}")
-    # reconfigure on conanfile changes
-    string(JSON CONANFILE GET ${conan_stdout} graph nodes 0 label)
-    message(STATUS "CMake-Conan: CONANFILE=${CMAKE_SOURCE_DIR}/${CONANFILE}")
-    set_property(DIRECTORY ${CMAKE_SOURCE_DIR} APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS "${CMAKE_SOURCE_DIR}/${CONANFILE}")
+    string(JSON _config ERROR_VARIABLE _json_error GET "${_json}" graph nodes 0 settings build_type)
+    if(_json_error)
+        set(_config "")
+    endif()
+    unset(_json)
+    conan_load_package_index("${output_folder}" "${_config}")
     # success
     set_property(GLOBAL PROPERTY CONAN_INSTALL_SUCCESS TRUE)
+    conan_timer_stop(conan_parse_install_output)
+endfunction()
+
+
+function(conan_install_deployers output_variable)
+    # Arguments of `conan install` that write to its output folder the index of the packages
+    # of the dependency graph, conan_packages_<config>.cmake, and the fingerprint of the
+    # graph, conan_graph_fingerprint_<config>.json. The deployers (cmake_conan_package_index.py
+    # and cmake_conan_graph_fingerprint.py, next to this file) run in the Conan process,
+    # which is much faster than querying the JSON output of large graphs in CMake.
+    set(${output_variable} "--deployer=${CMAKE_CURRENT_FUNCTION_LIST_DIR}/cmake_conan_package_index.py"
+                           "--deployer=${CMAKE_CURRENT_FUNCTION_LIST_DIR}/cmake_conan_graph_fingerprint.py" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_load_package_index output_folder config)
+    # Load the index of the packages written by the deployer, which sets the global properties:
+    #   CONAN_INSTALLED_PACKAGES: names of the packages in the host context
+    #   CONAN_PACKAGE_<name>_<field>[_<CONFIG>]: REF, PACKAGE_ID, BINARY (Cache, Download, Build...),
+    #       PACKAGE_FOLDER, INCLUDE_DIRS and LIB_DIRS of each of them
+    set(_index_file "${output_folder}/conan_packages.cmake")
+    if(config)
+        set(_index_file "${output_folder}/conan_packages_${config}.cmake")
+    endif()
+    if(NOT EXISTS "${_index_file}")
+        return()
+    endif()
+    set(_conan_built_from_source "")
+    include("${_index_file}")
+    if(_conan_built_from_source)
+        list(JOIN _conan_built_from_source ", " _conan_built_from_source)
+        message(STATUS "CMake-Conan: packages built from source: ${_conan_built_from_source}")
+    endif()
+endfunction()
+
+
+function(conan_install_parallel)
+    # Invoke "conan install" once per configuration, all of them running at the same time.
+    # Each invocation is wrapped in a CMake script that writes its JSON output and its
+    # log to separate files, so that the processes can be started with a single
+    # execute_process() call, and waited for together.
+    cmake_parse_arguments(ARGS "" "CONANFILE;OUTPUT_FOLDER" "CONFIGURATIONS;CONAN_ARGS" ${ARGN})
+    set(_conanfile_path ${CMAKE_SOURCE_DIR})
+    if(ARGS_CONANFILE)
+        set(_conanfile_path ${ARGS_CONANFILE})
+    endif()
+    set(CONAN_OUTPUT_FOLDER ${CMAKE_BINARY_DIR}/conan)
+    if(ARGS_OUTPUT_FOLDER)
+        set(CONAN_OUTPUT_FOLDER ${ARGS_OUTPUT_FOLDER})
+    endif()
+    file(MAKE_DIRECTORY ${CONAN_OUTPUT_FOLDER})
+
+    conan_install_deployers(_deployer_args)
+    # In offline mode, the scripts run in parallel do not use the remotes. In AUTO mode,
+    # the configurations that fail are tried again with the remotes (conan_install_<config>.cmake)
+    set(_commands "")
+    foreach(_config IN LISTS ARGS_CONFIGURATIONS)
+        set(_conan_args ${ARGS_CONAN_ARGS} -s build_type=${_config} -of=${CONAN_OUTPUT_FOLDER} ${_deployer_args})
+        set(_scripts ${_config})
+        if(CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+            list(APPEND _scripts ${_config}_offline)
+        endif()
+        foreach(_script_name IN LISTS _scripts)
+            set(_script_args ${_conan_args})
+            if(_script_name MATCHES "_offline$" OR (CONAN_PROVIDER_OFFLINE AND NOT CONAN_PROVIDER_OFFLINE STREQUAL "AUTO"))
+                conan_offline_install_args(_script_args ${_conan_args})
+            endif()
+            set(_command "")
+            foreach(_arg IN ITEMS ${CONAN_COMMAND} install ${_conanfile_path} ${_script_args} --format=json)
+                string(APPEND _command " [==[${_arg}]==]")
+            endforeach()
+            set(_script "${CONAN_OUTPUT_FOLDER}/conan_install_${_script_name}.cmake")
+            file(WRITE ${_script}
+                "execute_process(COMMAND${_command}\n"
+                "    RESULT_VARIABLE return_code\n"
+                "    OUTPUT_FILE [==[${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.json]==]\n"
+                "    ERROR_FILE [==[${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.log]==]\n"
+                "    WORKING_DIRECTORY [==[${CMAKE_CURRENT_BINARY_DIR}]==])\n"
+                "if(NOT return_code STREQUAL \"0\")\n"
+                "    message(FATAL_ERROR \"\${return_code}\")\n"
+                "endif()\n")
+        endforeach()
+        # The last script written is the one started in parallel
+        message(STATUS "CMake-Conan: conan install ${_conanfile_path} ${_script_args}")
+        list(APPEND _commands COMMAND ${CMAKE_COMMAND} -P ${_script})
+    endforeach()
+
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(_OLD_PATH $ENV{PATH})
+        set(ENV{PATH} "$ENV{PATH}:${PATH_TO_CMAKE_BIN}")
+    endif()
+
+    list(JOIN ARGS_CONFIGURATIONS "," _timer_configurations)
+    conan_timer_start("conan_install_parallel(${_timer_configurations})")
+    execute_process(${_commands}
+                    RESULTS_VARIABLE _return_codes
+                    OUTPUT_QUIET
+                    ERROR_QUIET)
+    conan_timer_stop("conan_install_parallel(${_timer_configurations})")
+
+    # The Conan cache does not support concurrent modifications of the same package,
+    # e.g. two configurations building the same missing binary from source. Failed
+    # configurations are tried again one after another before reporting an error.
+    set(_failed_report "")
+    foreach(_config _return_code IN ZIP_LISTS ARGS_CONFIGURATIONS _return_codes)
+        set(_log_file "${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.log")
+        if("${_return_code}" STREQUAL "0" AND CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+            message(STATUS "CMake-Conan: all packages for ${_config} found in the Conan cache, remotes were not used")
+        elseif(NOT "${_return_code}" STREQUAL "0")
+            set(_retry TRUE)
+            if(CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+                # Only packages missing from the cache are worth the remotes, other
+                # errors (e.g. a failed build or invalid settings) are reported as is
+                set(_log "")
+                if(EXISTS ${_log_file})
+                    file(READ ${_log_file} _log)
+                endif()
+                conan_install_missing_packages("${_log}" _retry)
+                if(_retry)
+                    message(STATUS "CMake-Conan: packages for ${_config} missing from the Conan cache, trying again with remotes")
+                endif()
+            else()
+                message(STATUS "CMake-Conan: conan install failed for ${_config} when running in parallel, trying again")
+            endif()
+            if(_retry)
+                execute_process(COMMAND ${CMAKE_COMMAND} -P "${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.cmake"
+                                RESULT_VARIABLE _return_code
+                                OUTPUT_QUIET
+                                ERROR_QUIET)
+            endif()
+        endif()
+        if(EXISTS ${_log_file})
+            file(READ ${_log_file} _log)
+            message(NOTICE "${_log}")
+        endif()
+        if(NOT "${_return_code}" STREQUAL "0")
+            string(APPEND _failed_report "\n  ${_config}: exit code ${_return_code}, see ${_log_file}")
+        endif()
+    endforeach()
+
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(ENV{PATH} "${_OLD_PATH}")
+    endif()
+    if(_failed_report)
+        message(FATAL_ERROR "Conan install failed for configuration(s):${_failed_report}")
+    endif()
+
+    foreach(_config IN LISTS ARGS_CONFIGURATIONS)
+        conan_parse_install_output("${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.json" ${CONAN_OUTPUT_FOLDER})
+    endforeach()
+endfunction()
+
+
+function(conan_install_single_process)
+    # Invoke `conan cmake-conan` (cmd_cmake_conan.py, next to this file) for CONANFILE into
+    # OUTPUT_FOLDER: the version check, the detection of the default profile and
+    # "conan install" for each of CONFIGURATIONS run in the same Conan process. Without
+    # configurations, a single install is done, as in conan_install().
+    cmake_parse_arguments(ARGS "DETECT_DEFAULT_PROFILE" "CONANFILE;OUTPUT_FOLDER;MINIMUM_VERSION" "CONFIGURATIONS;CONAN_ARGS" ${ARGN})
+    set(_conanfile_path ${CMAKE_SOURCE_DIR})
+    if(ARGS_CONANFILE)
+        set(_conanfile_path ${ARGS_CONANFILE})
+    endif()
+    set(CONAN_OUTPUT_FOLDER ${CMAKE_BINARY_DIR}/conan)
+    if(ARGS_OUTPUT_FOLDER)
+        set(CONAN_OUTPUT_FOLDER ${ARGS_OUTPUT_FOLDER})
+    endif()
+    file(MAKE_DIRECTORY ${CONAN_OUTPUT_FOLDER})
+
+    conan_copy_custom_command()
+
+    set(_command_args "")
+    if(ARGS_MINIMUM_VERSION)
+        list(APPEND _command_args --minimum-version=${ARGS_MINIMUM_VERSION})
+    endif()
+    if(ARGS_DETECT_DEFAULT_PROFILE)
+        list(APPEND _command_args --detect-default-profile)
+    endif()
+    if(ARGS_CONFIGURATIONS)
+        foreach(_config IN LISTS ARGS_CONFIGURATIONS)
+            list(APPEND _command_args --install "${CONAN_OUTPUT_FOLDER}/conan_install_${_config}.json" ${_config})
+        endforeach()
+    elseif(CMAKE_BUILD_TYPE)
+        list(APPEND _command_args --install "${CONAN_OUTPUT_FOLDER}/conan_install_${CMAKE_BUILD_TYPE}.json")
+    else()
+        list(APPEND _command_args --install "${CONAN_OUTPUT_FOLDER}/conan_install.json")
+    endif()
+    conan_install_deployers(_deployer_args)
+    set(_conan_args ${ARGS_CONAN_ARGS} -of=${CONAN_OUTPUT_FOLDER} ${_deployer_args})
+    if(CONAN_PROVIDER_OFFLINE)
+        conan_offline_install_args(_conan_args ${_conan_args})
+    endif()
+
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(_OLD_PATH $ENV{PATH})
+        set(ENV{PATH} "$ENV{PATH}:${PATH_TO_CMAKE_BIN}")
+    endif()
+
+    message(STATUS "CMake-Conan: conan cmake-conan ${_conanfile_path} ${_command_args} --install-args ${_conan_args}")
+    set(_result_file "${CONAN_OUTPUT_FOLDER}/conan_cmake_conan.json")
+    conan_timer_start(conan_install_single_process)
+    execute_process(COMMAND ${CONAN_COMMAND} cmake-conan ${_conanfile_path} ${_command_args} --format=json
+                            --install-args ${_conan_args}
+                    RESULT_VARIABLE return_code
+                    OUTPUT_FILE "${_result_file}"
+                    ERROR_VARIABLE conan_stderr
+                    ECHO_ERROR_VARIABLE    # show the text output regardless
+                    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR})
+    conan_timer_stop(conan_install_single_process)
+
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(ENV{PATH} "${_OLD_PATH}")
+    endif()
+
+    if(NOT "${return_code}" STREQUAL "0")
+        message(FATAL_ERROR "Conan install failed='${return_code}'")
+    endif()
 
+    # The version is cached for the next runs, as if conan_get_version() had probed it
+    file(READ "${_result_file}" _result)
+    string(JSON _conan_version GET "${_result}" conan_version)
+    conan_version_cache_key("${CONAN_COMMAND}" _version_key)
+    if(_version_key)
+        set(CONAN_VERSION_CACHED "${_conan_version}" CACHE INTERNAL "Version of the Conan executable")
+        set(CONAN_VERSION_CACHE_KEY "${_version_key}" CACHE INTERNAL "Conan executable the version was probed from")
+    endif()
+    string(JSON _profile_detected GET "${_result}" default_profile_detected)
+    if(_profile_detected)
+        message(STATUS "CMake-Conan: The default profile didn't exist, it was detected")
+    endif()
+    string(JSON _installs_count LENGTH "${_result}" installs)
+    math(EXPR _last_install "${_installs_count} - 1")
+    foreach(_index RANGE ${_last_install})
+        string(JSON _json_file GET "${_result}" installs ${_index} json_file)
+        conan_parse_install_output("${_json_file}" ${CONAN_OUTPUT_FOLDER})
+    endforeach()
+endfunction()
+
+
+function(conan_copy_custom_command)
+    # Custom commands are loaded from the Conan home
+    conan_home_folder(_conan_home)
+    file(MAKE_DIRECTORY "${_conan_home}/extensions/commands")
+    file(COPY_FILE "${CMAKE_CURRENT_FUNCTION_LIST_DIR}/cmd_cmake_conan.py"
+                   "${_conan_home}/extensions/commands/cmd_cmake_conan.py" ONLY_IF_DIFFERENT)
+endfunction()
+
+
+function(conan_version_cache_key conan_command output_variable)
+    # Identifies the Conan executable the cached version was probed from
+    set(_version_key "")
+    if(EXISTS "${conan_command}")
+        file(TIMESTAMP "${conan_command}" _timestamp "%Y-%m-%dT%H:%M:%S%f" UTC)
+        file(SIZE "${conan_command}" _size)
+        set(_version_key "${conan_command}|${_timestamp}|${_size}")
+    endif()
+    set(${output_variable} "${_version_key}" PARENT_SCOPE)
 endfunction()
 
 
 function(conan_get_version conan_command conan_current_version)
+    # The version is kept in the CMake cache, and is only probed again
+    # when the Conan executable changes. With CACHED_ONLY, it is not probed,
+    # and the result is empty if it is not cached.
+    conan_version_cache_key("${conan_command}" _version_key)
+    if(_version_key AND "${_version_key}" STREQUAL "${CONAN_VERSION_CACHE_KEY}")
+        set(${conan_current_version} ${CONAN_VERSION_CACHED} PARENT_SCOPE)
+        return()
+    elseif("CACHED_ONLY" IN_LIST ARGN)
+        set(${conan_current_version} "" PARENT_SCOPE)
+        return()
+    endif()
+
     execute_process(
         COMMAND ${conan_command} --version
         OUTPUT_VARIABLE conan_output
@@ -467,6 +944,10 @@ function(conan_get_version conan_command conan_current_version)
 
     string(REGEX MATCH "[0-9]+\\.[0-9]+\\.[0-9]+" conan_version ${conan_output})
     set(${conan_current_version} ${conan_version} PARENT_SCOPE)
+    if(_version_key)
+        set(CONAN_VERSION_CACHED "${conan_version}" CACHE INTERNAL "Version of the Conan executable")
+        set(CONAN_VERSION_CACHE_KEY "${_version_key}" CACHE INTERNAL "Conan executable the version was probed from")
+    endif()
 endfunction()
 
 
@@ -498,65 +979,1161 @@ macro(construct_profile_argument argument_variable profile_list)
         set(_arg_flag "--profile:build=")
     endif()
 
+    # The profile detected for auto-cmake is in the binary directory given as the third
+    # argument, or in CMAKE_BINARY_DIR
+    set(_binary_dir "${CMAKE_BINARY_DIR}")
+    if(${ARGC} GREATER 2)
+        set(_binary_dir "${ARGV2}")
+    endif()
     set(_profile_list "${${profile_list}}")
-    list(TRANSFORM _profile_list REPLACE "auto-cmake" "${CMAKE_BINARY_DIR}/conan_host_profile")
+    list(TRANSFORM _profile_list REPLACE "auto-cmake" "${_binary_dir}/conan_host_profile")
     list(TRANSFORM _profile_list PREPEND ${_arg_flag})
     set(${argument_variable} ${_profile_list})
 
     unset(_arg_flag)
+    unset(_binary_dir)
     unset(_profile_list)
 endmacro()
 
 
+function(conan_home_folder output_variable)
+    # Same lookup as Conan itself: CONAN_HOME, or ~/.conan2 otherwise
+    if(DEFINED ENV{CONAN_HOME})
+        file(TO_CMAKE_PATH "$ENV{CONAN_HOME}" _conan_home)
+    elseif(CMAKE_HOST_WIN32)
+        file(TO_CMAKE_PATH "$ENV{USERPROFILE}/.conan2" _conan_home)
+    else()
+        set(_conan_home "$ENV{HOME}/.conan2")
+    endif()
+    set(${output_variable} "${_conan_home}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_profile_file profile output_variable)
+    # Resolve a profile argument to a file the same way `conan install` does:
+    # absolute path, path relative to the working directory, or a name in the
+    # profiles folder of the Conan home. Empty if it cannot be resolved.
+    conan_home_folder(_conan_home)
+    set(_profile_file "")
+    if(IS_ABSOLUTE "${profile}")
+        if(EXISTS "${profile}")
+            set(_profile_file "${profile}")
+        endif()
+    elseif(EXISTS "${CMAKE_CURRENT_BINARY_DIR}/${profile}")
+        set(_profile_file "${CMAKE_CURRENT_BINARY_DIR}/${profile}")
+    elseif(EXISTS "${_conan_home}/profiles/${profile}")
+        set(_profile_file "${_conan_home}/profiles/${profile}")
+    endif()
+    set(${output_variable} "${_profile_file}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_lockfile_arguments project_source_dir source_folder output_variable)
+    # Lockfile arguments for `conan install`: CONAN_LOCKFILE, relative to the top-level source
+    # directory of the project, or conan.lock in the folder of the conanfile. Nothing is added
+    # if CONAN_INSTALL_ARGS already has lockfile arguments.
+    set(${output_variable} "" PARENT_SCOPE)
+    foreach(_arg IN LISTS CONAN_INSTALL_ARGS)
+        if(_arg MATCHES "^--lockfile" OR _arg STREQUAL "-l")
+            return()
+        endif()
+    endforeach()
+    if(CONAN_LOCKFILE)
+        get_filename_component(_lockfile "${CONAN_LOCKFILE}" ABSOLUTE BASE_DIR "${project_source_dir}")
+    else()
+        set(_lockfile "${source_folder}/conan.lock")
+    endif()
+
+    set(_lockfile_args "")
+    if(EXISTS "${_lockfile}")
+        list(APPEND _lockfile_args "--lockfile=${_lockfile}")
+        # Requirements missing from the lockfile are only allowed in partial mode,
+        # and are resolved and added to the lockfile when updating it
+        if(CONAN_LOCKFILE_PARTIAL OR CONAN_LOCKFILE_UPDATE)
+            list(APPEND _lockfile_args "--lockfile-partial")
+        endif()
+        set_property(DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR} APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS "${_lockfile}")
+    elseif(CONAN_LOCKFILE AND NOT CONAN_LOCKFILE_UPDATE)
+        message(FATAL_ERROR "CMake-Conan: lockfile ${_lockfile} does not exist. "
+                            "Set CONAN_LOCKFILE_UPDATE=ON to create it.")
+    endif()
+    if(CONAN_LOCKFILE_UPDATE)
+        list(APPEND _lockfile_args "--lockfile-out=${_lockfile}")
+    endif()
+    set(${output_variable} ${_lockfile_args} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_generated_conanfile_content requires output_variable)
+    # Contents of the conanfile.txt generated for the given requirements
+    list(JOIN requires "\n" _requires)
+    set(${output_variable} "# Generated by cmake-conan from CONAN_REQUIRES\n[requires]\n${_requires}\n\n[generators]\nCMakeDeps\n" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_generate_conanfile requires output_folder output_variable)
+    # Write a conanfile.txt with the given requirements to the output folder. It is only
+    # written when its contents change.
+    set(_conanfile "${output_folder}/conanfile.txt")
+    conan_generated_conanfile_content("${requires}" _content)
+    set(_previous_content "")
+    if(EXISTS "${_conanfile}")
+        file(READ "${_conanfile}" _previous_content)
+    endif()
+    if(NOT _content STREQUAL _previous_content)
+        file(WRITE "${_conanfile}" "${_content}")
+    endif()
+    set(${output_variable} "${_conanfile}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_check_cmakedeps_generator conanfile)
+    file(READ "${conanfile}" outfile)
+    if(NOT "${outfile}" MATCHES ".*CMakeDeps.*")
+        if(conanfile MATCHES "\\.py$")
+            message(WARNING "Cmake-conan: CMakeDeps generator was not defined in the conanfile")
+        else()
+            message(WARNING "Cmake-conan: CMakeDeps generator was not defined in the conanfile. "
+                    "Please define the generator as it will be mandatory in the future")
+        endif()
+    endif()
+endfunction()
+
+
+function(conan_normalize_conanfile content output_variable)
+    # Remove what does not change the meaning of a conanfile: comment lines,
+    # blank lines and trailing whitespace
+    string(REGEX REPLACE "[ \t\r]+\n" "\n" _content "\n${content}\n")
+    string(REGEX REPLACE "\n[ \t]*#[^\n]*" "" _content "${_content}")
+    string(REGEX REPLACE "\n\n+" "\n" _content "${_content}")
+    set(${output_variable} "${_content}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_inputs_hash output_variable)
+    # Hash everything but the conanfile that affects the result of `conan install`: the
+    # Conan version and home, the contents of every profile and the remaining arguments.
+    # The result is empty if some input cannot be resolved, which disables the reuse.
+    conan_home_folder(_conan_home)
+    set(_hash_input "${CONAN_COMMAND}\n${CONAN_CURRENT_VERSION}\n${_conan_home}\n")
+    set(_lockfile_value FALSE)
+    foreach(_arg IN LISTS ARGN)
+        if(_lockfile_value OR _arg MATCHES "^--lockfile=(.*)$")
+            # The lockfile is given as --lockfile=<path>, or as --lockfile <path> or -l <path>
+            if(_lockfile_value)
+                set(_lockfile "${_arg}")
+            else()
+                set(_lockfile "${CMAKE_MATCH_1}")
+            endif()
+            set(_lockfile_value FALSE)
+            # A relative path is resolved by Conan from its working directory
+            get_filename_component(_lockfile "${_lockfile}" ABSOLUTE BASE_DIR "${CMAKE_CURRENT_BINARY_DIR}")
+            set(_lockfile_content "")
+            if(EXISTS "${_lockfile}")
+                file(READ "${_lockfile}" _lockfile_content)
+            endif()
+            string(APPEND _hash_input "lockfile=${_lockfile_content}\n")
+        elseif(_arg STREQUAL "--lockfile" OR _arg STREQUAL "-l")
+            set(_lockfile_value TRUE)
+        elseif(_arg MATCHES "^--profile:(host|build)=(.*)$")
+            conan_profile_file("${CMAKE_MATCH_2}" _profile_file)
+            if(NOT _profile_file)
+                message(STATUS "CMake-Conan: unable to locate profile '${CMAKE_MATCH_2}', install results will not be reused")
+                set(${output_variable} "" PARENT_SCOPE)
+                return()
+            endif()
+            file(READ "${_profile_file}" _profile_content)
+            # The number of jobs doesn't change the packages that are installed
+            string(REGEX REPLACE "(^|\n)tools\\.build:jobs=[^\n]*" "" _profile_content "${_profile_content}")
+            string(APPEND _hash_input "profile:${CMAKE_MATCH_1}=${_profile_content}\n")
+        else()
+            string(APPEND _hash_input "${_arg}\n")
+        endif()
+    endforeach()
+    string(SHA256 _hash "${_hash_input}")
+    set(${output_variable} ${_hash} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_hash conanfile inputs_hash output_variable)
+    # Hash of the inputs of `conan install`, including the conanfile. The conanfile is
+    # hashed by name and normalized contents, so that build trees of different checkouts
+    # of the same project get the same hash, and comment or whitespace edits are ignored.
+    set(${output_variable} "" PARENT_SCOPE)
+    if(NOT inputs_hash)
+        return()
+    endif()
+    file(READ "${conanfile}" _conanfile_content)
+    conan_normalize_conanfile("${_conanfile_content}" _conanfile_content)
+    get_filename_component(_conanfile_name "${conanfile}" NAME)
+    string(SHA256 _hash "${inputs_hash}\n${_conanfile_name}\n${_conanfile_content}")
+    set(${output_variable} ${_hash} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_graph_fingerprint conanfile fingerprint_file output_variable)
+    # Fingerprint of what a conanfile.py contributes to the results of `conan install`.
+    # The fields of the graph it depends on are written to fingerprint_file by the
+    # cmake_conan_graph_fingerprint.py deployer of `conan install` or `conan graph info`:
+    # the reference, package_id, settings and options of every node, which change with
+    # e.g. the default_options of a dependency, and the dependencies, generators and
+    # python_requires (with their revisions) of the root node.
+    # The code of the conanfile that runs in `conan install` is not reflected in the graph:
+    # its normalized source is used instead, without the methods that `conan install`
+    # does not run for the consumer.
+    if(NOT EXISTS "${fingerprint_file}")
+        set(${output_variable} "" PARENT_SCOPE)
+        return()
+    endif()
+    file(READ "${fingerprint_file}" _fingerprint)
+    file(READ "${conanfile}" _conanfile_content)
+    set(_conanfile_content "\n${_conanfile_content}")
+    foreach(_method IN ITEMS source build package test export export_sources)
+        # The method ends at the first line that is not blank and not indented more than its definition
+        if("${_conanfile_content}" MATCHES "\n([ \t]*)def ${_method}\\(")
+            set(_indent "${CMAKE_MATCH_1}")
+            string(FIND "${_conanfile_content}" "${CMAKE_MATCH_0}" _start)
+            string(SUBSTRING "${_conanfile_content}" ${_start} -1 _method_source)
+            string(REGEX MATCH "^\n[^\n]*(\n(${_indent}[ \t][^\n]*|[ \t]*))*" _method_source "${_method_source}")
+            string(REPLACE "${_method_source}" "\n" _conanfile_content "${_conanfile_content}")
+        endif()
+    endforeach()
+    conan_normalize_conanfile("${_conanfile_content}" _conanfile_content)
+    string(APPEND _fingerprint "\nconanfile=${_conanfile_content}\n")
+    string(SHA256 _fingerprint "${_fingerprint}")
+    set(${output_variable} ${_fingerprint} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_stamp_check install_hash output_folder result_variable)
+    # Reuse the results of a previous `conan install` into output_folder, if it was
+    # done with the same inputs and the generated files are still there
+    set(${result_variable} FALSE PARENT_SCOPE)
+    set(_stamp_file "${output_folder}/conan_install_stamp.json")
+    if(NOT install_hash OR NOT EXISTS "${_stamp_file}")
+        return()
+    endif()
+    file(READ "${_stamp_file}" _stamp)
+    string(JSON _stamp_hash ERROR_VARIABLE _json_error GET "${_stamp}" hash)
+    if(_json_error OR NOT _stamp_hash STREQUAL install_hash)
+        return()
+    endif()
+    string(JSON _generators_folder GET "${_stamp}" generators_folder)
+    if(NOT IS_DIRECTORY "${_generators_folder}")
+        return()
+    endif()
+    # The packages may have been removed from the Conan cache since, e.g. by `conan remove`:
+    # the package folders in the files generated by CMakeDeps and in the package index
+    file(GLOB _data_files "${_generators_folder}/*-data.cmake")
+    file(GLOB _package_index_files "${output_folder}/conan_packages*.cmake")
+    foreach(_data_file IN LISTS _data_files _package_index_files)
+        file(STRINGS "${_data_file}" _package_folders REGEX "_PACKAGE_FOLDER(_[A-Za-z0-9_]+ \"|\\]==\\] \\[==\\[)")
+        foreach(_package_folder IN LISTS _package_folders)
+            string(REGEX REPLACE "^.*_PACKAGE_FOLDER[A-Za-z0-9_]* \"([^\"]*)\".*$" "\\1" _package_folder "${_package_folder}")
+            string(REGEX REPLACE "^.*_PACKAGE_FOLDER[A-Za-z0-9_]*\\]==\\] \\[==\\[(.*)\\]==\\]\\)$" "\\1" _package_folder "${_package_folder}")
+            if(_package_folder AND NOT _package_folder MATCHES "\\\$\\{" AND NOT IS_DIRECTORY "${_package_folder}")
+                message(STATUS "CMake-Conan: package folder ${_package_folder} no longer exists, 'conan install' runs again")
+                return()
+            endif()
+        endforeach()
+    endforeach()
+    message(STATUS "CMake-Conan: inputs unchanged since last 'conan install', reusing ${_generators_folder}")
+    set_property(GLOBAL PROPERTY CONAN_GENERATORS_FOLDER "${_generators_folder}")
+    foreach(_package_index_file IN LISTS _package_index_files)
+        include("${_package_index_file}")
+    endforeach()
+    set_property(GLOBAL PROPERTY CONAN_INSTALL_SUCCESS TRUE)
+    set(${result_variable} TRUE PARENT_SCOPE)
+endfunction()
+
+
+function(conan_graph_info_args output_variable)
+    # The arguments of `conan install` (ARGN) that `conan graph info` accepts: the
+    # ones that only apply to the install, e.g. generators and deployers, are left out
+    set(_graph_args "")
+    set(_skip_value FALSE)
+    foreach(_arg IN LISTS ARGN)
+        if(_skip_value)
+            set(_skip_value FALSE)
+        elseif(_arg MATCHES "^(-g|--generator|-of|--output-folder|-d|--deployer|-df|--deployer-folder|--deployer-package|--envs-generation)$")
+            set(_skip_value TRUE)
+        elseif(NOT _arg MATCHES "^(-g|--generator|-of|--output-folder|-d|--deployer|-df|--deployer-folder|--deployer-package|--envs-generation|--lockfile-out)=")
+            list(APPEND _graph_args "${_arg}")
+        endif()
+    endforeach()
+    set(${output_variable} ${_graph_args} PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_graph_check conanfile install_hash inputs_hash output_folder build_type result_variable)
+    # When only a conanfile.py changed since the previous `conan install` into output_folder,
+    # compare the root node of its graph, as given by `conan graph info` with the same
+    # arguments (ARGN), to the one of the previous install. If they are the same, the
+    # changes don't affect the results of `conan install`, and the stamp is updated.
+    set(${result_variable} FALSE PARENT_SCOPE)
+    set(_stamp_file "${output_folder}/conan_install_stamp.json")
+    if(NOT conanfile MATCHES "\\.py$" OR NOT install_hash OR NOT EXISTS "${_stamp_file}")
+        return()
+    endif()
+    file(READ "${_stamp_file}" _stamp)
+    string(JSON _stamp_inputs_hash ERROR_VARIABLE _json_error GET "${_stamp}" inputs_hash)
+    string(JSON _stamp_fingerprint ERROR_VARIABLE _json_error GET "${_stamp}" graph_fingerprint)
+    if(_json_error OR NOT _stamp_inputs_hash STREQUAL inputs_hash)
+        return()
+    endif()
+
+    conan_graph_info_args(_graph_args ${ARGN})
+    if(build_type)
+        list(APPEND _graph_args -s build_type=${build_type})
+    endif()
+    if(CONAN_PROVIDER_OFFLINE)
+        conan_offline_install_args(_graph_args ${_graph_args})
+    endif()
+
+    message(STATUS "CMake-Conan: ${conanfile} changed, checking its dependency graph")
+    # The deployer of `conan graph info` writes to the working directory
+    file(GLOB _fingerprint_files "${CMAKE_CURRENT_BINARY_DIR}/conan_graph_fingerprint*.json")
+    if(_fingerprint_files)
+        file(REMOVE ${_fingerprint_files})
+    endif()
+    conan_timer_start(conan_graph_info)
+    execute_process(COMMAND ${CONAN_COMMAND} graph info ${conanfile} ${_graph_args}
+                            --deployer=${CMAKE_CURRENT_FUNCTION_LIST_DIR}/cmake_conan_graph_fingerprint.py
+                    RESULT_VARIABLE _return_code
+                    OUTPUT_QUIET
+                    ERROR_QUIET
+                    WORKING_DIRECTORY ${CMAKE_CURRENT_BINARY_DIR})
+    conan_timer_stop(conan_graph_info)
+    file(GLOB _fingerprint_files "${CMAKE_CURRENT_BINARY_DIR}/conan_graph_fingerprint*.json")
+    set(_fingerprint "")
+    if(_return_code STREQUAL "0" AND _fingerprint_files)
+        list(GET _fingerprint_files 0 _fingerprint_file)
+        conan_graph_fingerprint("${conanfile}" "${_fingerprint_file}" _fingerprint)
+    endif()
+    if(_fingerprint_files)
+        file(REMOVE ${_fingerprint_files})
+    endif()
+    if(NOT _fingerprint OR NOT _fingerprint STREQUAL _stamp_fingerprint)
+        return()
+    endif()
+    message(STATUS "CMake-Conan: the changes to ${conanfile} don't affect 'conan install'")
+    string(JSON _stamp SET "${_stamp}" hash "\"${install_hash}\"")
+    file(WRITE "${_stamp_file}" "${_stamp}")
+    set(${result_variable} TRUE PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_clean output_folder)
+    # Remove the results of a previous `conan install` that a new one does not overwrite.
+    # With KEEP_DEPLOYED, the files written by the deployers of the install are kept.
+    file(GLOB _files "${output_folder}/conan_install_stamp.json"
+                     "${output_folder}/conan_find_package_index.cmake")
+    if(NOT "KEEP_DEPLOYED" IN_LIST ARGN)
+        file(GLOB _deployed_files "${output_folder}/conan_packages*.cmake"
+                                  "${output_folder}/conan_graph_fingerprint*.json")
+        list(APPEND _files ${_deployed_files})
+    endif()
+    if(_files)
+        file(REMOVE ${_files})
+    endif()
+endfunction()
+
+
+function(conan_install_stamp_write install_hash inputs_hash output_folder conanfile build_type)
+    if(NOT install_hash)
+        return()
+    endif()
+    get_property(_generators_folder GLOBAL PROPERTY CONAN_GENERATORS_FOLDER)
+    set(_stamp "{}")
+    string(JSON _stamp SET "${_stamp}" hash "\"${install_hash}\"")
+    string(JSON _stamp SET "${_stamp}" inputs_hash "\"${inputs_hash}\"")
+    string(JSON _stamp SET "${_stamp}" generators_folder "\"${_generators_folder}\"")
+    string(JSON _stamp SET "${_stamp}" conanfile "\"${conanfile}\"")
+    # The graph of the build_type installed first, compared by conan_install_graph_check()
+    if(conanfile MATCHES "\\.py$")
+        set(_fingerprint_file "${output_folder}/conan_graph_fingerprint.json")
+        if(build_type)
+            set(_fingerprint_file "${output_folder}/conan_graph_fingerprint_${build_type}.json")
+        endif()
+        conan_graph_fingerprint("${conanfile}" "${_fingerprint_file}" _graph_fingerprint)
+        if(_graph_fingerprint)
+            string(JSON _stamp SET "${_stamp}" graph_fingerprint "\"${_graph_fingerprint}\"")
+        endif()
+    endif()
+    file(WRITE "${output_folder}/conan_install_stamp.json" "${_stamp}")
+endfunction()
+
+
+function(conan_shared_cache_acquire install_hash output_variable)
+    # Folder of the shared cache for the results of `conan install` with the given
+    # inputs. It is locked until conan_shared_cache_release(), so that only one build
+    # tree populates it, and the others wait and reuse it.
+    string(SUBSTRING "${install_hash}" 0 16 _key)
+    get_filename_component(_cache_folder "${CONAN_PROVIDER_SHARED_CACHE}" ABSOLUTE)
+    set(_entry "${_cache_folder}/${_key}")
+    file(MAKE_DIRECTORY "${_cache_folder}")
+    file(LOCK "${_entry}.lock" GUARD PROCESS TIMEOUT 0 RESULT_VARIABLE _lock_result)
+    if(NOT _lock_result STREQUAL "0")
+        message(STATUS "CMake-Conan: waiting for another build tree to install into ${_entry}")
+        file(LOCK "${_entry}.lock" GUARD PROCESS)
+    endif()
+    set(${output_variable} "${_entry}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_shared_cache_release entry)
+    # Record the use of an entry of the shared cache, unlock it, and evict the least
+    # recently used entries beyond CONAN_PROVIDER_SHARED_CACHE_MAX_ENTRIES, and those
+    # unused for CONAN_PROVIDER_SHARED_CACHE_MAX_AGE days. Entries locked by other
+    # build trees are left alone.
+    file(TOUCH "${entry}/conan_shared_cache_used")
+    file(LOCK "${entry}.lock" RELEASE)
+
+    get_filename_component(_cache_folder "${entry}" DIRECTORY)
+    file(GLOB _used_files "${_cache_folder}/*/conan_shared_cache_used")
+    set(_entries "")
+    foreach(_used_file IN LISTS _used_files)
+        file(TIMESTAMP "${_used_file}" _used "%s" UTC)
+        get_filename_component(_candidate "${_used_file}" DIRECTORY)
+        list(APPEND _entries "${_used}|${_candidate}")
+    endforeach()
+    list(SORT _entries COMPARE NATURAL ORDER DESCENDING)
+    string(TIMESTAMP _now "%s" UTC)
+    math(EXPR _oldest "${_now} - ${CONAN_PROVIDER_SHARED_CACHE_MAX_AGE} * 86400")
+    set(_count 0)
+    foreach(_item IN LISTS _entries)
+        string(REPLACE "|" ";" _item "${_item}")
+        list(GET _item 0 _used)
+        list(GET _item 1 _candidate)
+        math(EXPR _count "${_count} + 1")
+        if(_candidate STREQUAL entry
+           OR (_count LESS_EQUAL CONAN_PROVIDER_SHARED_CACHE_MAX_ENTRIES AND _used GREATER_EQUAL _oldest))
+            continue()
+        endif()
+        file(LOCK "${_candidate}.lock" GUARD FUNCTION TIMEOUT 0 RESULT_VARIABLE _lock_result)
+        if(_lock_result STREQUAL "0")
+            message(STATUS "CMake-Conan: removing ${_candidate} from the shared cache")
+            file(REMOVE_RECURSE "${_candidate}")
+            file(LOCK "${_candidate}.lock" RELEASE)
+        endif()
+    endforeach()
+endfunction()
+
+
+function(conan_shared_cache_install_acquire profiles_hash)
+    # Lock the installs of the build trees sharing the cache with the same Conan home and
+    # profiles, given by profiles_hash, until conan_shared_cache_install_release(). They
+    # install into different entries, but may build the same binaries into the Conan cache,
+    # which concurrent `conan install --build=missing` could corrupt. Build trees with other
+    # profiles build other binaries, and reusing an entry doesn't write to the Conan cache,
+    # so these run in parallel.
+    string(SUBSTRING "${profiles_hash}" 0 16 _key)
+    get_filename_component(_cache_folder "${CONAN_PROVIDER_SHARED_CACHE}" ABSOLUTE)
+    file(LOCK "${_cache_folder}/conan_cache_${_key}.lock" GUARD PROCESS TIMEOUT 0 RESULT_VARIABLE _lock_result)
+    if(NOT _lock_result STREQUAL "0")
+        message(STATUS "CMake-Conan: waiting for another build tree with the same profiles to finish installing")
+        file(LOCK "${_cache_folder}/conan_cache_${_key}.lock" GUARD PROCESS)
+    endif()
+endfunction()
+
+
+function(conan_shared_cache_install_release profiles_hash)
+    string(SUBSTRING "${profiles_hash}" 0 16 _key)
+    get_filename_component(_cache_folder "${CONAN_PROVIDER_SHARED_CACHE}" ABSOLUTE)
+    file(LOCK "${_cache_folder}/conan_cache_${_key}.lock" RELEASE)
+endfunction()
+
+
+function(conan_build_type_folder_acquire folder)
+    # Lock the folder of a build type, see CONAN_INSTALL_PER_BUILD_TYPE, until
+    # conan_build_type_folder_release(). A background install into the folder holds
+    # the same lock, so that it is waited for rather than done again.
+    file(MAKE_DIRECTORY "${folder}")
+    file(LOCK "${folder}/conan_install.lock" GUARD PROCESS TIMEOUT 0 RESULT_VARIABLE _lock_result)
+    if(NOT _lock_result STREQUAL "0")
+        message(STATUS "CMake-Conan: waiting for the background install into ${folder}")
+        file(LOCK "${folder}/conan_install.lock" GUARD PROCESS)
+    endif()
+endfunction()
+
+
+function(conan_build_type_folder_release folder)
+    file(LOCK "${folder}/conan_install.lock" RELEASE)
+endfunction()
+
+
+function(conan_run_detached script log_file)
+    # Run a CMake script in a process that outlives the configure
+    if(CMAKE_HOST_WIN32)
+        execute_process(COMMAND cmd /c start "" /min "${CMAKE_COMMAND}" -P "${script}"
+                        OUTPUT_QUIET ERROR_QUIET)
+    else()
+        execute_process(COMMAND sh -c "\"$0\" -P \"$1\" > \"$2\" 2>&1 < /dev/null &"
+                                "${CMAKE_COMMAND}" "${script}" "${log_file}"
+                        OUTPUT_QUIET ERROR_QUIET)
+    endif()
+endfunction()
+
+
+function(conan_preinstall_check install_hash folder result_variable)
+    # Use the results of a background install into the folder of a build type, if it
+    # was done with the given inputs. The folder must be locked.
+    set(${result_variable} FALSE PARENT_SCOPE)
+    set(_hash_file "${folder}/conan_preinstall_hash")
+    if(NOT EXISTS "${_hash_file}")
+        return()
+    endif()
+    file(READ "${_hash_file}" _preinstall_hash)
+    file(REMOVE "${_hash_file}")
+    set(_json_file "${folder}/conan_install_${CMAKE_BUILD_TYPE}.json")
+    if(NOT install_hash OR NOT _preinstall_hash STREQUAL install_hash OR NOT EXISTS "${_json_file}")
+        return()
+    endif()
+    message(STATUS "CMake-Conan: using the background install of ${CMAKE_BUILD_TYPE} into ${folder}")
+    conan_parse_install_output("${_json_file}" "${folder}")
+    set(${result_variable} TRUE PARENT_SCOPE)
+endfunction()
+
+
+function(conan_preinstall_start conanfile output_folder host_profile)
+    # Start the install of each build type of CONAN_PREINSTALL_BUILD_TYPES into its folder
+    # in the background, with the arguments of the install of CMAKE_BUILD_TYPE (ARGN), and
+    # a copy of the detected host_profile for that build type. Build types whose folder
+    # already has the results of an install with the same inputs are skipped.
+    file(READ "${host_profile}" _profile)
+    conan_install_deployers(_deployer_args)
+    set(_command_env "")
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(_command_env "set(ENV{PATH} [==[$ENV{PATH}:${PATH_TO_CMAKE_BIN}]==])\n")
+    endif()
+    foreach(_build_type IN LISTS CONAN_PREINSTALL_BUILD_TYPES)
+        if(_build_type STREQUAL CMAKE_BUILD_TYPE)
+            continue()
+        endif()
+        set(_folder "${output_folder}/${_build_type}")
+        file(MAKE_DIRECTORY "${_folder}")
+        string(REGEX REPLACE "\nbuild_type=[^\n]*\n" "\nbuild_type=${_build_type}\n" _build_type_profile "${_profile}")
+        set(_previous_profile "")
+        if(EXISTS "${_folder}/conan_host_profile")
+            file(READ "${_folder}/conan_host_profile" _previous_profile)
+        endif()
+        if(NOT _build_type_profile STREQUAL _previous_profile)
+            file(WRITE "${_folder}/conan_host_profile" "${_build_type_profile}")
+        endif()
+        set(_conan_args "")
+        foreach(_arg IN LISTS ARGN)
+            if(_arg STREQUAL "--profile:host=${host_profile}")
+                set(_arg "--profile:host=${_folder}/conan_host_profile")
+            endif()
+            list(APPEND _conan_args "${_arg}")
+        endforeach()
+        conan_install_inputs_hash(_inputs_hash ${_conan_args} "configurations=")
+        conan_install_hash("${conanfile}" "${_inputs_hash}" _install_hash)
+        if(NOT _install_hash)
+            continue()
+        endif()
+
+        # Skip the build types already installed, or being installed
+        set(_installed_hash "")
+        if(EXISTS "${_folder}/conan_install_stamp.json")
+            file(READ "${_folder}/conan_install_stamp.json" _stamp)
+            string(JSON _installed_hash ERROR_VARIABLE _json_error GET "${_stamp}" hash)
+        elseif(EXISTS "${_folder}/conan_preinstall_hash")
+            file(READ "${_folder}/conan_preinstall_hash" _installed_hash)
+        endif()
+        if(_installed_hash STREQUAL _install_hash)
+            continue()
+        endif()
+        file(LOCK "${_folder}/conan_install.lock" GUARD FUNCTION TIMEOUT 0 RESULT_VARIABLE _lock_result)
+        if(NOT _lock_result STREQUAL "0")
+            continue()
+        endif()
+        file(LOCK "${_folder}/conan_install.lock" RELEASE)
+
+        if(CONAN_PROVIDER_OFFLINE AND NOT CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+            conan_offline_install_args(_conan_args ${_conan_args})
+        endif()
+        set(_command "")
+        foreach(_arg IN ITEMS ${CONAN_COMMAND} install ${conanfile} ${_conan_args} -of=${_folder} ${_deployer_args} --format=json)
+            string(APPEND _command " [==[${_arg}]==]")
+        endforeach()
+        set(_script "${_folder}/conan_preinstall.cmake")
+        file(WRITE "${_script}"
+            "file(LOCK [==[${_folder}/conan_install.lock]==] GUARD PROCESS TIMEOUT 0 RESULT_VARIABLE _lock_result)\n"
+            "if(NOT _lock_result STREQUAL \"0\")\n"
+            "    return()\n"
+            "endif()\n"
+            "file(REMOVE [==[${_folder}/conan_preinstall_hash]==])\n"
+            "${_command_env}"
+            "execute_process(COMMAND${_command}\n"
+            "    RESULT_VARIABLE return_code\n"
+            "    OUTPUT_FILE [==[${_folder}/conan_install_${_build_type}.json]==]\n"
+            "    ERROR_FILE [==[${_folder}/conan_preinstall.log]==]\n"
+            "    WORKING_DIRECTORY [==[${CMAKE_CURRENT_BINARY_DIR}]==])\n"
+            "if(return_code STREQUAL \"0\")\n"
+            "    file(WRITE [==[${_folder}/conan_preinstall_hash]==] [==[${_install_hash}]==])\n"
+            "endif()\n")
+        message(STATUS "CMake-Conan: installing ${_build_type} in the background, see ${_folder}/conan_preinstall.log")
+        conan_run_detached("${_script}" "${_folder}/conan_preinstall_output.log")
+    endforeach()
+endfunction()
+
+
+function(conan_prefetch_start)
+    # Start resolving the dependency graph of the conanfile of the top-level project in the
+    # background, when the provider is included and before project() detects the compilers.
+    # The recipes and the binaries that are the same for any host compiler (build context
+    # and settings-independent packages) are downloaded, so that the `conan install` of the
+    # first find_package() mostly finds them in the cache. It waits for the prefetch to
+    # finish in conan_prefetch_wait(), as both use the Conan cache.
+    if(CONAN_PROVIDER_OFFLINE)
+        return()
+    endif()
+    if(EXISTS "${CMAKE_SOURCE_DIR}/conanfile.py")
+        set(_conanfile "${CMAKE_SOURCE_DIR}/conanfile.py")
+    elseif(EXISTS "${CMAKE_SOURCE_DIR}/conanfile.txt")
+        set(_conanfile "${CMAKE_SOURCE_DIR}/conanfile.txt")
+    else()
+        return()
+    endif()
+    find_program(CONAN_COMMAND "conan")
+    if(NOT CONAN_COMMAND)
+        return()
+    endif()
+    conan_lockfile_arguments("${CMAKE_SOURCE_DIR}" "${CMAKE_SOURCE_DIR}" _lockfile_args)
+
+    # The host profile detected by a previous run is used if there is one
+    set(_profiles "")
+    foreach(_profile_list IN ITEMS CONAN_HOST_PROFILE CONAN_BUILD_PROFILE)
+        construct_profile_argument(_profile_args ${_profile_list})
+        foreach(_arg IN LISTS _profile_args)
+            if(NOT _arg MATCHES "=${CMAKE_BINARY_DIR}/conan_host_profile$" OR EXISTS "${CMAKE_BINARY_DIR}/conan_host_profile")
+                list(APPEND _profiles "${_arg}")
+            endif()
+        endforeach()
+    endforeach()
+    conan_graph_info_args(_graph_args ${_profiles} ${CONAN_INSTALL_ARGS} ${_lockfile_args})
+    if(CMAKE_BUILD_TYPE)
+        list(APPEND _graph_args -s build_type=${CMAKE_BUILD_TYPE})
+    endif()
+    set(_command_args "")
+    if("default" IN_LIST CONAN_HOST_PROFILE OR "default" IN_LIST CONAN_BUILD_PROFILE)
+        list(APPEND _command_args --detect-default-profile)
+    endif()
+
+    # Nothing new is downloaded if the conanfile, the lockfile and the arguments are
+    # the same as in the previous prefetch, and the dependencies were installed since
+    set(_folder "${CMAKE_BINARY_DIR}/conan_prefetch")
+    file(READ "${_conanfile}" _prefetch_input)
+    string(APPEND _prefetch_input "\n${CONAN_INSTALL_ARGS}")
+    foreach(_arg IN LISTS _lockfile_args)
+        if(_arg MATCHES "^--lockfile=(.*)$")
+            file(READ "${CMAKE_MATCH_1}" _lockfile_content)
+            string(APPEND _prefetch_input "\n${_lockfile_content}")
+        endif()
+    endforeach()
+    string(SHA256 _prefetch_hash "${_prefetch_input}")
+    file(GLOB_RECURSE _stamp_files "${CMAKE_BINARY_DIR}/conan/conan_install_stamp.json")
+    if(_stamp_files AND EXISTS "${_folder}/conan_prefetch_hash")
+        file(READ "${_folder}/conan_prefetch_hash" _previous_hash)
+        if(_previous_hash STREQUAL _prefetch_hash)
+            return()
+        endif()
+    endif()
+    # The custom command requires Conan 2.2.0 or later
+    if(CONAN_SKIP_VERSION_CHECK)
+        conan_get_version(${CONAN_COMMAND} _conan_version CACHED_ONLY)
+    else()
+        conan_get_version(${CONAN_COMMAND} _conan_version)
+    endif()
+    if(_conan_version AND _conan_version VERSION_LESS 2.2.0)
+        message(STATUS "CMake-Conan: CONAN_PROVIDER_PREFETCH requires Conan 2.2.0 or later, "
+                       "Conan ${_conan_version} does not prefetch")
+        return()
+    endif()
+    file(MAKE_DIRECTORY "${_folder}")
+    file(WRITE "${_folder}/conan_prefetch_hash" "${_prefetch_hash}")
+    file(REMOVE "${_folder}/conan_prefetch_done")
+    conan_copy_custom_command()
+    set(_command_env "")
+    if(DEFINED PATH_TO_CMAKE_BIN)
+        set(_command_env "set(ENV{PATH} [==[$ENV{PATH}:${PATH_TO_CMAKE_BIN}]==])\n")
+    endif()
+    set(_command "")
+    foreach(_arg IN ITEMS ${CONAN_COMMAND} cmake-conan ${_conanfile} ${_command_args}
+                          --prefetch=${_folder}/conan_prefetch_graph.json --format=json --install-args ${_graph_args})
+        string(APPEND _command " [==[${_arg}]==]")
+    endforeach()
+    set(_script "${_folder}/conan_prefetch.cmake")
+    file(WRITE "${_script}"
+        "file(LOCK [==[${_folder}/conan_prefetch.lock]==] GUARD PROCESS TIMEOUT 0 RESULT_VARIABLE _lock_result)\n"
+        "if(NOT _lock_result STREQUAL \"0\")\n"
+        "    return()\n"
+        "endif()\n"
+        "${_command_env}"
+        "execute_process(COMMAND${_command}\n"
+        "    RESULT_VARIABLE return_code\n"
+        "    OUTPUT_FILE [==[${_folder}/conan_prefetch.json]==]\n"
+        "    ERROR_FILE [==[${_folder}/conan_prefetch.log]==]\n"
+        "    WORKING_DIRECTORY [==[${CMAKE_BINARY_DIR}]==])\n"
+        "file(WRITE [==[${_folder}/conan_prefetch_done]==] \"\${return_code}\")\n")
+    message(STATUS "CMake-Conan: prefetching the dependencies of ${_conanfile} in the background, see ${_folder}/conan_prefetch.log")
+    conan_run_detached("${_script}" "${_folder}/conan_prefetch_output.log")
+    set_property(GLOBAL PROPERTY CONAN_PREFETCH_FOLDER "${_folder}")
+endfunction()
+
+
+function(conan_prefetch_wait)
+    # Wait for the prefetch started by conan_prefetch_start() to finish, before the first
+    # Conan command of the configure. It may not have taken its lock yet.
+    get_property(_folder GLOBAL PROPERTY CONAN_PREFETCH_FOLDER)
+    if(NOT _folder)
+        return()
+    endif()
+    set_property(GLOBAL PROPERTY CONAN_PREFETCH_FOLDER "")
+    string(TIMESTAMP _start "%s")
+    while(NOT EXISTS "${_folder}/conan_prefetch_done")
+        file(LOCK "${_folder}/conan_prefetch.lock" GUARD FUNCTION TIMEOUT 0 RESULT_VARIABLE _lock_result)
+        if(NOT _lock_result STREQUAL "0")
+            message(STATUS "CMake-Conan: waiting for the background prefetch, see ${_folder}/conan_prefetch.log")
+            conan_timer_start(conan_prefetch_wait)
+            file(LOCK "${_folder}/conan_prefetch.lock" GUARD FUNCTION)
+            conan_timer_stop(conan_prefetch_wait)
+            break()
+        endif()
+        file(LOCK "${_folder}/conan_prefetch.lock" RELEASE)
+        string(TIMESTAMP _now "%s")
+        math(EXPR _elapsed "${_now} - ${_start}")
+        if(_elapsed GREATER 10)
+            message(STATUS "CMake-Conan: the background prefetch didn't start, see ${_folder}/conan_prefetch_output.log")
+            break()
+        endif()
+        execute_process(COMMAND ${CMAKE_COMMAND} -E sleep 0.1)
+    endwhile()
+endfunction()
+
+
+function(conan_find_package_index output_folder)
+    # Load the index of the config and find-module files in the generators folder,
+    # creating it after a new `conan install`. For each package it sets the global
+    # properties CONAN_FIND_PACKAGE_CONFIG_<name>|<generators folder> and
+    # CONAN_FIND_PACKAGE_MODULE_<name>|<generators folder>, where <name> is in lower
+    # case, to the path of the file. The generators folder tells apart the installs of
+    # different folders (CONAN_PROVIDER_PER_DIRECTORY) and build types.
+    set(_index_file "${output_folder}/conan_find_package_index.cmake")
+    get_property(_generators_folder GLOBAL PROPERTY CONAN_GENERATORS_FOLDER)
+    if(NOT IS_DIRECTORY "${_generators_folder}")
+        return()
+    endif()
+    if(EXISTS "${_index_file}")
+        include("${_index_file}")
+    endif()
+    # The index is created again if it was written for another generators folder
+    get_property(_index_loaded GLOBAL PROPERTY "CONAN_FIND_PACKAGE_INDEX|${_generators_folder}" SET)
+    if(_index_loaded)
+        return()
+    endif()
+    file(GLOB _files LIST_DIRECTORIES false
+         "${_generators_folder}/*-config.cmake"
+         "${_generators_folder}/*Config.cmake"
+         "${_generators_folder}/Find*.cmake")
+    list(SORT _files)
+    set(_index "")
+    foreach(_file IN LISTS _files)
+        get_filename_component(_file_name "${_file}" NAME)
+        if(_file_name MATCHES "^(.+)-config\\.cmake$")
+            set(_kind CONFIG)
+        elseif(_file_name MATCHES "^(.+)Config\\.cmake$")
+            set(_kind CONFIG)
+        elseif(_file_name MATCHES "^Find(.+)\\.cmake$")
+            set(_kind MODULE)
+        else()
+            continue()
+        endif()
+        string(TOLOWER "${CMAKE_MATCH_1}" _name)
+        string(APPEND _index "set_property(GLOBAL PROPERTY [==[CONAN_FIND_PACKAGE_${_kind}_${_name}|${_generators_folder}]==] [==[${_file}]==])\n")
+    endforeach()
+    string(APPEND _index "set_property(GLOBAL PROPERTY [==[CONAN_FIND_PACKAGE_INDEX|${_generators_folder}]==] TRUE)\n")
+    file(WRITE "${_index_file}" "${_index}")
+    include("${_index_file}")
+endfunction()
+
+
+function(conan_project_folders source_dir_variable binary_dir_variable)
+    # Top-level source and binary directories of the project whose dependencies are
+    # installed: those of the CMake project, or those given to conan_prewarm(), which
+    # configures another project to detect the settings.
+    get_property(_source_dir GLOBAL PROPERTY CONAN_PREWARM_SOURCE_DIR)
+    get_property(_binary_dir GLOBAL PROPERTY CONAN_PREWARM_BINARY_DIR)
+    if(NOT _source_dir OR NOT _binary_dir)
+        set(_source_dir "${CMAKE_SOURCE_DIR}")
+        set(_binary_dir "${CMAKE_BINARY_DIR}")
+    endif()
+    set(${source_dir_variable} "${_source_dir}" PARENT_SCOPE)
+    set(${binary_dir_variable} "${_binary_dir}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_install_folders project_source_dir project_binary_dir source_folder_variable output_folder_variable)
+    # Folder of the conanfile that provides the packages to the current source directory,
+    # and the output folder of its install. With CONAN_PROVIDER_PER_DIRECTORY, this is the
+    # closest folder with a conanfile, from the current source directory up to the top-level
+    # one, and the output folder is the corresponding build folder.
+    set(_source_folder "${project_source_dir}")
+    if(CONAN_PROVIDER_PER_DIRECTORY)
+        set(_folder "${CMAKE_CURRENT_SOURCE_DIR}")
+        cmake_path(IS_PREFIX project_source_dir "${_folder}" NORMALIZE _in_source_tree)
+        while(_in_source_tree AND NOT _folder STREQUAL project_source_dir)
+            if(EXISTS "${_folder}/conanfile.py" OR EXISTS "${_folder}/conanfile.txt")
+                set(_source_folder "${_folder}")
+                break()
+            endif()
+            get_filename_component(_folder "${_folder}" DIRECTORY)
+        endwhile()
+    endif()
+    if(_source_folder STREQUAL project_source_dir)
+        set(_output_folder "${project_binary_dir}/conan")
+    else()
+        file(RELATIVE_PATH _relative_folder "${project_source_dir}" "${_source_folder}")
+        set(_output_folder "${project_binary_dir}/${_relative_folder}/conan")
+    endif()
+    set(${source_folder_variable} "${_source_folder}" PARENT_SCOPE)
+    set(${output_folder_variable} "${_output_folder}" PARENT_SCOPE)
+endfunction()
+
+
+function(conan_lazy_install_requested package_name project_source_dir source_folder output_folder result_variable)
+    # Whether package_name may be provided by Conan, and `conan install` must run to find it.
+    # The names of the provided packages are CONAN_PROVIDED_PACKAGES or, otherwise, the
+    # find_package() names in the index of a previous install, if it is newer than the
+    # conanfile. Names are compared case-insensitively. The names of the requirements are
+    # not used: they are Conan reference names (e.g. libcurl), which may differ from the
+    # find_package() names (e.g. CURL). Without names, `conan install` runs for any package.
+    set(_names ${CONAN_PROVIDED_PACKAGES})
+    if(NOT _names)
+        set(_index_file "${output_folder}/conan_find_package_index.cmake")
+        if(CONAN_INSTALL_PER_BUILD_TYPE AND CMAKE_BUILD_TYPE)
+            set(_index_file "${output_folder}/${CMAKE_BUILD_TYPE}/conan_find_package_index.cmake")
+        endif()
+        set(_conanfile "")
+        if(CONAN_REQUIRES AND source_folder STREQUAL project_source_dir)
+            # The conanfile generated by the previous install must have the same requirements
+            conan_generated_conanfile_content("${CONAN_REQUIRES}" _content)
+            set(_previous_content "")
+            if(EXISTS "${output_folder}/conanfile.txt")
+                file(READ "${output_folder}/conanfile.txt" _previous_content)
+            endif()
+            if(_content STREQUAL _previous_content)
+                set(_conanfile "${output_folder}/conanfile.txt")
+            endif()
+        elseif(EXISTS "${source_folder}/conanfile.py")
+            set(_conanfile "${source_folder}/conanfile.py")
+        elseif(EXISTS "${source_folder}/conanfile.txt")
+            set(_conanfile "${source_folder}/conanfile.txt")
+        endif()
+        if(_conanfile AND EXISTS "${_index_file}" AND NOT "${_conanfile}" IS_NEWER_THAN "${_index_file}")
+            file(STRINGS "${_index_file}" _index_entries REGEX "CONAN_FIND_PACKAGE_(CONFIG|MODULE)_")
+            foreach(_entry IN LISTS _index_entries)
+                string(REGEX MATCH "CONAN_FIND_PACKAGE_(CONFIG|MODULE)_([^]|]+)[]|]" _match "${_entry}")
+                list(APPEND _names ${CMAKE_MATCH_2})
+            endforeach()
+        endif()
+    endif()
+    if(NOT _names)
+        set(${result_variable} TRUE PARENT_SCOPE)
+        return()
+    endif()
+    string(TOLOWER "${_names}" _names)
+    string(TOLOWER "${package_name}" _name)
+    if(_name IN_LIST _names)
+        set(${result_variable} TRUE PARENT_SCOPE)
+    else()
+        set(${result_variable} FALSE PARENT_SCOPE)
+    endif()
+endfunction()
+
+
+function(conan_find_package_index_lookup package_name generators_folder config_file module_file)
+    # Config and find-module files provided by Conan for package_name in the index of
+    # generators_folder, empty if there are none. Only file names that find_package()
+    # itself would consider, and files that still exist, are returned.
+    string(TOLOWER "${package_name}" _name)
+    get_property(_config_file GLOBAL PROPERTY "CONAN_FIND_PACKAGE_CONFIG_${_name}|${generators_folder}")
+    get_property(_module_file GLOBAL PROPERTY "CONAN_FIND_PACKAGE_MODULE_${_name}|${generators_folder}")
+    if(NOT EXISTS "${_config_file}")
+        set(_config_file "")
+    endif()
+    if(NOT EXISTS "${_module_file}")
+        set(_module_file "")
+    endif()
+    get_filename_component(_config_file_name "${_config_file}" NAME)
+    if(NOT _config_file_name STREQUAL "${package_name}Config.cmake" AND NOT _config_file_name STREQUAL "${_name}-config.cmake")
+        set(_config_file "")
+    endif()
+    get_filename_component(_module_file_name "${_module_file}" NAME)
+    if(NOT _module_file_name STREQUAL "Find${package_name}.cmake")
+        set(_module_file "")
+    endif()
+    set(${config_file} "${_config_file}" PARENT_SCOPE)
+    set(${module_file} "${_module_file}" PARENT_SCOPE)
+endfunction()
+
+
 macro(conan_provide_dependency method package_name)
     set_property(GLOBAL PROPERTY CONAN_PROVIDE_DEPENDENCY_INVOKED TRUE)
-    get_property(_conan_install_success GLOBAL PROPERTY CONAN_INSTALL_SUCCESS)
-    if(NOT _conan_install_success)
+    conan_project_folders(_conan_project_source_dir _conan_project_binary_dir)
+    conan_install_folders("${_conan_project_source_dir}" "${_conan_project_binary_dir}" _conan_source_folder _conan_output_folder)
+    get_property(_conan_install_success GLOBAL PROPERTY CONAN_GENERATORS_FOLDER_${_conan_output_folder} SET)
+    set(_conan_find_mode_${package_name} "")
+    if(CONAN_PROVIDER_LAZY AND NOT _conan_install_success)
+        conan_lazy_install_requested(${package_name} "${_conan_project_source_dir}" "${_conan_source_folder}" "${_conan_output_folder}" _conan_install_requested)
+        if(NOT _conan_install_requested)
+            set(_conan_find_mode_${package_name} NONE)
+        endif()
+        unset(_conan_install_requested)
+    endif()
+    if(_conan_find_mode_${package_name} STREQUAL "NONE")
+        message(STATUS "CMake-Conan: find_package(${package_name}) is not provided by Conan, 'conan install' deferred")
+        unset(_conan_install_success)
+    elseif(NOT _conan_install_success)
+        # Search again if the executable found in a previous run is gone
+        if(IS_ABSOLUTE "${CONAN_COMMAND}" AND NOT EXISTS "${CONAN_COMMAND}")
+            unset(CONAN_COMMAND CACHE)
+        endif()
         find_program(CONAN_COMMAND "conan" REQUIRED)
-        conan_get_version(${CONAN_COMMAND} CONAN_CURRENT_VERSION)
-        conan_version_check(MINIMUM ${CONAN_MINIMUM_VERSION} CURRENT ${CONAN_CURRENT_VERSION})
+        conan_prefetch_wait()
+        # In single process mode, the version check and the detection of the default
+        # profile are done by the same Conan process as the installs
+        set(_conan_single_process FALSE)
+        if(CONAN_PROVIDER_SINGLE_PROCESS AND NOT CONAN_PROVIDER_OFFLINE STREQUAL "AUTO")
+            set(_conan_single_process TRUE)
+        endif()
+        if(NOT CONAN_SKIP_VERSION_CHECK AND _conan_single_process)
+            # The custom command requires Conan 2.2.0 or later: the version is probed the
+            # first time, and then taken from the CMake cache
+            conan_timer_start(conan_version_check)
+            conan_get_version(${CONAN_COMMAND} CONAN_CURRENT_VERSION)
+            conan_timer_stop(conan_version_check)
+            if(CONAN_CURRENT_VERSION VERSION_LESS 2.2.0)
+                message(STATUS "CMake-Conan: CONAN_PROVIDER_SINGLE_PROCESS requires Conan 2.2.0 or later, "
+                               "Conan ${CONAN_CURRENT_VERSION} is run separately for each step")
+                set(_conan_single_process FALSE)
+                conan_version_check(MINIMUM ${CONAN_MINIMUM_VERSION} CURRENT ${CONAN_CURRENT_VERSION})
+            endif()
+        elseif(NOT CONAN_SKIP_VERSION_CHECK)
+            conan_timer_start(conan_version_check)
+            conan_get_version(${CONAN_COMMAND} CONAN_CURRENT_VERSION)
+            conan_version_check(MINIMUM ${CONAN_MINIMUM_VERSION} CURRENT ${CONAN_CURRENT_VERSION})
+            conan_timer_stop(conan_version_check)
+        endif()
         message(STATUS "CMake-Conan: first find_package() found. Installing dependencies with Conan")
+        set(_conan_detect_default_profile FALSE)
         if("default" IN_LIST CONAN_HOST_PROFILE OR "default" IN_LIST CONAN_BUILD_PROFILE)
+            set(_conan_detect_default_profile TRUE)
+        endif()
+        if(_conan_detect_default_profile AND NOT _conan_single_process)
+            conan_timer_start(conan_profile_detect_default)
             conan_profile_detect_default()
+            conan_timer_stop(conan_profile_detect_default)
         endif()
         if("auto-cmake" IN_LIST CONAN_HOST_PROFILE)
-            detect_host_profile(${CMAKE_BINARY_DIR}/conan_host_profile)
-        endif()
-        construct_profile_argument(_host_profile_flags CONAN_HOST_PROFILE)
-        construct_profile_argument(_build_profile_flags CONAN_BUILD_PROFILE)
-        if(EXISTS "${CMAKE_SOURCE_DIR}/conanfile.py")
-            file(READ "${CMAKE_SOURCE_DIR}/conanfile.py" outfile)
-            if(NOT "${outfile}" MATCHES ".*CMakeDeps.*")
-                message(WARNING "Cmake-conan: CMakeDeps generator was not defined in the conanfile")
-            endif()
-            set(generator "")
-        elseif (EXISTS "${CMAKE_SOURCE_DIR}/conanfile.txt")
-            file(READ "${CMAKE_SOURCE_DIR}/conanfile.txt" outfile)
-            if(NOT "${outfile}" MATCHES ".*CMakeDeps.*")
-                message(WARNING "Cmake-conan: CMakeDeps generator was not defined in the conanfile. "
-                        "Please define the generator as it will be mandatory in the future")
+            conan_timer_start(detect_host_profile)
+            detect_host_profile(${_conan_project_binary_dir}/conan_host_profile)
+            conan_timer_stop(detect_host_profile)
+        endif()
+        construct_profile_argument(_host_profile_flags CONAN_HOST_PROFILE "${_conan_project_binary_dir}")
+        construct_profile_argument(_build_profile_flags CONAN_BUILD_PROFILE "${_conan_project_binary_dir}")
+        set(_conanfile "")
+        set(generator "")
+        set(_conan_generated_conanfile FALSE)
+        if(CONAN_REQUIRES AND _conan_source_folder STREQUAL _conan_project_source_dir)
+            if(EXISTS "${_conan_source_folder}/conanfile.py" OR EXISTS "${_conan_source_folder}/conanfile.txt")
+                message(WARNING "CMake-Conan: CONAN_REQUIRES is set, the conanfile in ${_conan_source_folder} is ignored")
             endif()
+            conan_generate_conanfile("${CONAN_REQUIRES}" "${_conan_output_folder}" _conanfile)
+            set(_conan_generated_conanfile TRUE)
+        elseif(EXISTS "${_conan_source_folder}/conanfile.py")
+            set(_conanfile "${_conan_source_folder}/conanfile.py")
+        elseif (EXISTS "${_conan_source_folder}/conanfile.txt")
+            set(_conanfile "${_conan_source_folder}/conanfile.txt")
             set(generator "-g;CMakeDeps")
         endif()
         get_property(_multiconfig_generator GLOBAL PROPERTY GENERATOR_IS_MULTI_CONFIG)
-        if(NOT _multiconfig_generator)
-            message(STATUS "CMake-Conan: Installing single configuration ${CMAKE_BUILD_TYPE}")
-            conan_install(${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator})
-        else()
-            message(STATUS "CMake-Conan: Installing both Debug and Release")
-            conan_install(${_host_profile_flags} ${_build_profile_flags} -s build_type=Release ${CONAN_INSTALL_ARGS} ${generator})
-            conan_install(${_host_profile_flags} ${_build_profile_flags} -s build_type=Debug ${CONAN_INSTALL_ARGS} ${generator})
+        set(_conan_install_configurations "")
+        if(_multiconfig_generator)
+            set(_conan_install_configurations ${CONAN_INSTALL_CONFIGURATIONS})
+            if(NOT _conan_install_configurations)
+                set(_conan_install_configurations Release Debug)
+            endif()
+        endif()
+        set(_conan_lockfile_args "")
+        set(_conan_install_inputs_hash "")
+        set(_conan_install_hash "")
+        if(_conanfile)
+            conan_lockfile_arguments("${_conan_project_source_dir}" "${_conan_source_folder}" _conan_lockfile_args)
+            conan_install_inputs_hash(_conan_install_inputs_hash
+                                      ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args}
+                                      "configurations=${_conan_install_configurations}")
+            conan_install_hash("${_conanfile}" "${_conan_install_inputs_hash}" _conan_install_hash)
+        endif()
+        # The graph of conanfile.py is checked against the first configuration installed
+        set(_conan_graph_build_type "${CMAKE_BUILD_TYPE}")
+        if(_conan_install_configurations)
+            list(GET _conan_install_configurations 0 _conan_graph_build_type)
+        endif()
+        # Build trees with the same inputs share the results of `conan install` in
+        # CONAN_PROVIDER_SHARED_CACHE, unless the install writes to the lockfile
+        set(_conan_install_folder "${_conan_output_folder}")
+        set(_conan_install_folder_lock "")
+        if(CONAN_PROVIDER_SHARED_CACHE AND _conan_install_hash AND NOT CONAN_LOCKFILE_UPDATE)
+            conan_shared_cache_acquire("${_conan_install_hash}" _conan_install_folder)
+            set(_conan_install_folder_lock SHARED_CACHE)
+        elseif(CONAN_INSTALL_PER_BUILD_TYPE AND NOT _multiconfig_generator AND CMAKE_BUILD_TYPE)
+            # Single-configuration builds keep the results of each build type in a subfolder
+            set(_conan_install_folder "${_conan_output_folder}/${CMAKE_BUILD_TYPE}")
+            conan_build_type_folder_acquire("${_conan_install_folder}")
+            set(_conan_install_folder_lock BUILD_TYPE)
+        endif()
+        conan_install_stamp_check("${_conan_install_hash}" "${_conan_install_folder}" _conan_install_reused)
+        if(NOT _conan_install_reused AND NOT CONAN_LOCKFILE_UPDATE AND _conanfile)
+            set(_conan_graph_check_build_type "")
+            if(_conan_install_configurations)
+                set(_conan_graph_check_build_type "${_conan_graph_build_type}")
+            endif()
+            conan_install_graph_check("${_conanfile}" "${_conan_install_hash}" "${_conan_install_inputs_hash}" "${_conan_install_folder}"
+                                      "${_conan_graph_check_build_type}" _conan_install_reused
+                                      ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+            if(_conan_install_reused)
+                conan_install_stamp_check("${_conan_install_hash}" "${_conan_install_folder}" _conan_install_reused)
+            endif()
+            unset(_conan_graph_check_build_type)
         endif()
+        set(_conan_profiles_hash "")
+        if(NOT _conan_install_reused AND _conan_install_folder_lock STREQUAL "SHARED_CACHE")
+            conan_install_inputs_hash(_conan_profiles_hash ${_host_profile_flags} ${_build_profile_flags})
+            conan_shared_cache_install_acquire("${_conan_profiles_hash}")
+        endif()
+        if(NOT _conan_install_reused)
+            if(_conan_source_folder STREQUAL _conan_project_source_dir)
+                conan_prewarm_generator_check("${_conan_project_binary_dir}")
+            endif()
+            set(_conan_preinstalled FALSE)
+            if(_conan_install_folder_lock STREQUAL "BUILD_TYPE")
+                conan_preinstall_check("${_conan_install_hash}" "${_conan_install_folder}" _conan_preinstalled)
+            endif()
+            if(_conan_preinstalled)
+                conan_install_clean("${_conan_install_folder}" KEEP_DEPLOYED)
+            else()
+                conan_install_clean("${_conan_install_folder}")
+            endif()
+            if(_conanfile AND NOT _conan_generated_conanfile)
+                conan_check_cmakedeps_generator("${_conanfile}")
+            endif()
+            if(_conan_preinstalled)
+                # Installed in the background by a previous configure
+            elseif(_conan_single_process)
+                set(_conan_single_process_args "")
+                if(NOT CONAN_SKIP_VERSION_CHECK)
+                    list(APPEND _conan_single_process_args MINIMUM_VERSION ${CONAN_MINIMUM_VERSION})
+                endif()
+                if(_conan_detect_default_profile)
+                    list(APPEND _conan_single_process_args DETECT_DEFAULT_PROFILE)
+                endif()
+                message(STATUS "CMake-Conan: Installing dependencies in a single Conan process")
+                conan_install_single_process(CONANFILE "${_conanfile}" OUTPUT_FOLDER "${_conan_install_folder}" CONFIGURATIONS ${_conan_install_configurations}
+                                             ${_conan_single_process_args}
+                                             CONAN_ARGS ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+                unset(_conan_single_process_args)
+                if(NOT CONAN_SKIP_VERSION_CHECK)
+                    conan_get_version(${CONAN_COMMAND} CONAN_CURRENT_VERSION CACHED_ONLY)
+                endif()
+            elseif(NOT _multiconfig_generator)
+                message(STATUS "CMake-Conan: Installing single configuration ${CMAKE_BUILD_TYPE}")
+                conan_install(CONANFILE "${_conanfile}" OUTPUT_FOLDER "${_conan_install_folder}" ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+            elseif(CONAN_INSTALL_PARALLEL AND NOT CONAN_LOCKFILE_UPDATE)
+                message(STATUS "CMake-Conan: Installing configurations ${_conan_install_configurations} in parallel")
+                conan_install_parallel(CONANFILE "${_conanfile}" OUTPUT_FOLDER "${_conan_install_folder}" CONFIGURATIONS ${_conan_install_configurations}
+                                       CONAN_ARGS ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+            else()
+                # Configurations updating the same lockfile are installed one after another
+                message(STATUS "CMake-Conan: Installing configurations ${_conan_install_configurations}")
+                foreach(_conan_install_configuration IN LISTS _conan_install_configurations)
+                    conan_install(CONANFILE "${_conanfile}" OUTPUT_FOLDER "${_conan_install_folder}" ${_host_profile_flags} ${_build_profile_flags} -s build_type=${_conan_install_configuration} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+                endforeach()
+                unset(_conan_install_configuration)
+            endif()
+            if((CONAN_LOCKFILE_UPDATE OR _conan_single_process) AND _conanfile)
+                # The stamp refers to the lockfile as written by this install, and to the
+                # Conan version and default profile, which may only be known after it
+                conan_lockfile_arguments("${_conan_project_source_dir}" "${_conan_source_folder}" _conan_lockfile_args)
+                conan_install_inputs_hash(_conan_install_inputs_hash
+                                          ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args}
+                                          "configurations=${_conan_install_configurations}")
+                conan_install_hash("${_conanfile}" "${_conan_install_inputs_hash}" _conan_install_hash)
+            endif()
+            conan_install_stamp_write("${_conan_install_hash}" "${_conan_install_inputs_hash}" "${_conan_install_folder}" "${_conanfile}" "${_conan_graph_build_type}")
+            if(_conanfile)
+                message(STATUS "CMake-Conan: CONANFILE=${_conanfile}")
+            endif()
+        endif()
+        if(_conan_profiles_hash)
+            conan_shared_cache_install_release("${_conan_profiles_hash}")
+        endif()
+        unset(_conan_profiles_hash)
+        # reconfigure on conanfile changes
+        if(_conanfile)
+            set_property(DIRECTORY ${CMAKE_CURRENT_SOURCE_DIR} APPEND PROPERTY CMAKE_CONFIGURE_DEPENDS "${_conanfile}")
+        endif()
+        conan_find_package_index("${_conan_install_folder}")
+        if(_conan_install_folder_lock STREQUAL "SHARED_CACHE")
+            conan_shared_cache_release("${_conan_install_folder}")
+        elseif(_conan_install_folder_lock STREQUAL "BUILD_TYPE")
+            conan_build_type_folder_release("${_conan_install_folder}")
+            # Other build types are installed in the background, with the detected profile
+            if(CONAN_PREINSTALL_BUILD_TYPES AND _conanfile AND "auto-cmake" IN_LIST CONAN_HOST_PROFILE AND NOT CONAN_LOCKFILE_UPDATE)
+                conan_preinstall_start("${_conanfile}" "${_conan_output_folder}" "${_conan_project_binary_dir}/conan_host_profile"
+                                       ${_host_profile_flags} ${_build_profile_flags} ${CONAN_INSTALL_ARGS} ${generator} ${_conan_lockfile_args})
+            endif()
+        endif()
+        get_property(_conan_generators_folder GLOBAL PROPERTY CONAN_GENERATORS_FOLDER)
+        set_property(GLOBAL PROPERTY CONAN_GENERATORS_FOLDER_${_conan_output_folder} "${_conan_generators_folder}")
         unset(_host_profile_flags)
         unset(_build_profile_flags)
         unset(_multiconfig_generator)
+        unset(_conan_install_configurations)
+        unset(_conanfile)
+        unset(_conan_generated_conanfile)
+        unset(_conan_install_folder)
+        unset(_conan_install_folder_lock)
+        unset(_conan_preinstalled)
+        unset(_conan_install_hash)
+        unset(_conan_install_inputs_hash)
+        unset(_conan_graph_build_type)
+        unset(_conan_lockfile_args)
+        unset(_conan_install_reused)
         unset(_conan_install_success)
+        unset(_conan_single_process)
+        unset(_conan_detect_default_profile)
     else()
         message(STATUS "CMake-Conan: find_package(${ARGV1}) found, 'conan install' already ran")
         unset(_conan_install_success)
     endif()
 
-    get_property(_conan_generators_folder GLOBAL PROPERTY CONAN_GENERATORS_FOLDER)
+    get_property(_conan_generators_folder GLOBAL PROPERTY CONAN_GENERATORS_FOLDER_${_conan_output_folder})
+    # A config file found in the folder of another build type (CONAN_INSTALL_PER_BUILD_TYPE)
+    # is forgotten, as find_package() would keep using it
+    if(DEFINED CACHE{${package_name}_DIR} AND NOT "${${package_name}_DIR}" STREQUAL "${_conan_generators_folder}")
+        cmake_path(IS_PREFIX _conan_output_folder "${${package_name}_DIR}" NORMALIZE _conan_stale_dir)
+        if(_conan_stale_dir)
+            unset(${package_name}_DIR CACHE)
+        endif()
+        unset(_conan_stale_dir)
+    endif()
+    unset(_conan_project_source_dir)
+    unset(_conan_project_binary_dir)
+    unset(_conan_source_folder)
+    unset(_conan_output_folder)
+    conan_timer_start("find_package(${package_name})")
 
     # Ensure that we consider Conan-provided packages ahead of any other,
     # irrespective of other settings that modify the search order or search paths
@@ -565,36 +2142,179 @@ macro(conan_provide_dependency method package_name)
     #       find_package (<PackageName> PATHS paths... NO_DEFAULT_PATH)
     #       find_package (<PackageName>)
 
-    # Filter out `REQUIRED` from the argument list, as the first call may fail
+    # The index of the generators folder tells which packages Conan provides, and with which file.
+    # It cannot be used when alternative names are given.
     set(_find_args_${package_name} "${ARGN}")
-    list(REMOVE_ITEM _find_args_${package_name} "REQUIRED")
-    if(NOT "MODULE" IN_LIST _find_args_${package_name})
-        find_package(${package_name} ${_find_args_${package_name}} BYPASS_PROVIDER PATHS "${_conan_generators_folder}" NO_DEFAULT_PATH NO_CMAKE_FIND_ROOT_PATH)
-        unset(_find_args_${package_name})
+    get_property(_conan_find_package_index GLOBAL PROPERTY "CONAN_FIND_PACKAGE_INDEX|${_conan_generators_folder}")
+    if(NOT _conan_find_mode_${package_name} AND _conan_find_package_index
+       AND NOT "NAMES" IN_LIST _find_args_${package_name}
+       AND NOT "CONFIGS" IN_LIST _find_args_${package_name})
+        conan_find_package_index_lookup(${package_name} "${_conan_generators_folder}" _conan_config_file_${package_name} _conan_module_file)
+        if(_conan_config_file_${package_name} AND NOT "MODULE" IN_LIST _find_args_${package_name})
+            set(_conan_find_mode_${package_name} CONFIG)
+        elseif(_conan_module_file)
+            set(_conan_find_mode_${package_name} MODULE)
+        else()
+            set(_conan_find_mode_${package_name} NONE)
+        endif()
+        unset(_conan_module_file)
     endif()
-
-    # Invoke find_package a second time - if the first call succeeded,
-    # this will simply reuse the result. If not, fall back to CMake default search
-    # behaviour, also allowing modules to be searched.
-    if(NOT ${package_name}_FOUND)
-        list(FIND CMAKE_MODULE_PATH "${_conan_generators_folder}" _index)
-        if(_index EQUAL -1)
-            list(PREPEND CMAKE_MODULE_PATH "${_conan_generators_folder}")
+    unset(_conan_find_package_index)
+
+    if(_conan_find_mode_${package_name} STREQUAL "CONFIG")
+        # Conan-provided config file: load it directly, without searching anywhere else.
+        # If that fails, the packages are searched for as without the index.
+        get_filename_component(_conan_config_dir "${_conan_config_file_${package_name}}" DIRECTORY)
+        get_filename_component(_conan_config_name "${_conan_config_file_${package_name}}" NAME)
+        set(_conan_config_args ${ARGN})
+        list(REMOVE_ITEM _conan_config_args "REQUIRED")
+        find_package(${package_name} ${_conan_config_args} BYPASS_PROVIDER CONFIGS ${_conan_config_name} PATHS "${_conan_config_dir}" NO_DEFAULT_PATH NO_CMAKE_FIND_ROOT_PATH)
+        if(NOT ${package_name}_FOUND)
+            message(STATUS "CMake-Conan: ${_conan_config_file_${package_name}} did not provide ${package_name}, searching again")
+            set(_conan_find_mode_${package_name} "")
         endif()
-        unset(_index)
+        unset(_conan_config_dir)
+        unset(_conan_config_name)
+        unset(_conan_config_args)
+    endif()
+    if(_conan_find_mode_${package_name} STREQUAL "NONE")
+        # Not provided by Conan: only CMake default search behaviour applies
         find_package(${package_name} ${ARGN} BYPASS_PROVIDER)
-        list(REMOVE_ITEM CMAKE_MODULE_PATH "${_conan_generators_folder}")
+    elseif(NOT _conan_find_mode_${package_name} STREQUAL "CONFIG")
+        # Filter out `REQUIRED` from the argument list, as the first call may fail
+        list(REMOVE_ITEM _find_args_${package_name} "REQUIRED")
+        if(NOT "MODULE" IN_LIST _find_args_${package_name} AND NOT _conan_find_mode_${package_name} STREQUAL "MODULE")
+            find_package(${package_name} ${_find_args_${package_name}} BYPASS_PROVIDER PATHS "${_conan_generators_folder}" NO_DEFAULT_PATH NO_CMAKE_FIND_ROOT_PATH)
+        endif()
+
+        # Invoke find_package a second time - if the first call succeeded,
+        # this will simply reuse the result. If not, fall back to CMake default search
+        # behaviour, also allowing modules to be searched.
+        if(NOT ${package_name}_FOUND)
+            list(FIND CMAKE_MODULE_PATH "${_conan_generators_folder}" _index)
+            if(_index EQUAL -1)
+                list(PREPEND CMAKE_MODULE_PATH "${_conan_generators_folder}")
+            endif()
+            unset(_index)
+            find_package(${package_name} ${ARGN} BYPASS_PROVIDER)
+            list(REMOVE_ITEM CMAKE_MODULE_PATH "${_conan_generators_folder}")
+        endif()
     endif()
+    unset(_find_args_${package_name})
+    unset(_conan_find_mode_${package_name})
+    unset(_conan_config_file_${package_name})
+    conan_timer_stop("find_package(${package_name})")
 endmacro()
 
 
+function(conan_prewarm_generator_check binary_dir)
+    # The detected host profile has the CMake generator, so dependencies installed by
+    # conan_prewarm() with another generator than the project's are not reused
+    if(NOT EXISTS "${binary_dir}/conan_prewarm/build/CMakeCache.txt")
+        return()
+    endif()
+    file(STRINGS "${binary_dir}/conan_prewarm/build/CMakeCache.txt" _prewarm_generator
+         REGEX "^CMAKE_GENERATOR:INTERNAL=" LIMIT_COUNT 1)
+    string(REPLACE "CMAKE_GENERATOR:INTERNAL=" "" _prewarm_generator "${_prewarm_generator}")
+    if(_prewarm_generator AND NOT _prewarm_generator STREQUAL CMAKE_GENERATOR)
+        message(WARNING "CMake-Conan: the dependencies were prewarmed with the generator '${_prewarm_generator}', "
+                        "which differs from the generator of the project '${CMAKE_GENERATOR}', and are installed again. "
+                        "Set CONAN_PREWARM_GENERATOR to the generator of the project.")
+    endif()
+endfunction()
+
+
+function(conan_prewarm)
+    # Install the dependencies of a project before it is configured, in script mode:
+    #   cmake -DCONAN_PREWARM_SOURCE_DIR=<source> -DCONAN_PREWARM_BINARY_DIR=<build> [-D<var>=<value>...] -P conan_provider.cmake
+    # The settings are detected by configuring an empty project with the same -D arguments
+    # (e.g. CMAKE_BUILD_TYPE, CMAKE_TOOLCHAIN_FILE, CMAKE_CXX_COMPILER, CONAN_* variables),
+    # the languages in CONAN_PREWARM_LANGUAGES and the generator in CONAN_PREWARM_GENERATOR.
+    # The dependencies are installed into the output folder of <build>, where the configure
+    # of the project reuses them if the inputs of `conan install` are the same.
+    if(NOT CONAN_PREWARM_SOURCE_DIR OR NOT CONAN_PREWARM_BINARY_DIR)
+        message(FATAL_ERROR "CMake-Conan: usage: cmake -DCONAN_PREWARM_SOURCE_DIR=<source> "
+                            "-DCONAN_PREWARM_BINARY_DIR=<build> [-D<var>=<value>...] -P conan_provider.cmake")
+    endif()
+    get_filename_component(_source_dir "${CONAN_PREWARM_SOURCE_DIR}" ABSOLUTE)
+    get_filename_component(_binary_dir "${CONAN_PREWARM_BINARY_DIR}" ABSOLUTE)
+    set(_languages C CXX)
+    if(CONAN_PREWARM_LANGUAGES)
+        set(_languages ${CONAN_PREWARM_LANGUAGES})
+    endif()
+    # The project installs the dependencies of the source folder into the binary folder,
+    # as if the find_package() call was made by the project itself, see conan_project_folders()
+    set(_prewarm_folder "${_binary_dir}/conan_prewarm")
+    file(WRITE "${_prewarm_folder}/src/CMakeLists.txt"
+        "cmake_minimum_required(VERSION 3.24)\n"
+        "project(conan_prewarm LANGUAGES ${_languages})\n"
+        "set_property(GLOBAL PROPERTY CONAN_PREWARM_SOURCE_DIR [==[${_source_dir}]==])\n"
+        "set_property(GLOBAL PROPERTY CONAN_PREWARM_BINARY_DIR [==[${_binary_dir}]==])\n"
+        "find_package(conan_prewarm QUIET)\n")
+
+    set(_configure_args "")
+    if(CONAN_PREWARM_GENERATOR)
+        list(APPEND _configure_args -G "${CONAN_PREWARM_GENERATOR}")
+    endif()
+    math(EXPR _last_arg "${CMAKE_ARGC} - 1")
+    foreach(_index RANGE 1 ${_last_arg})
+        if(CMAKE_ARGV${_index} MATCHES "^-D" AND NOT CMAKE_ARGV${_index} MATCHES "^-DCONAN_PREWARM_")
+            list(APPEND _configure_args "${CMAKE_ARGV${_index}}")
+        endif()
+    endforeach()
+    message(STATUS "CMake-Conan: installing the dependencies of ${_source_dir} into ${_binary_dir}")
+    execute_process(COMMAND ${CMAKE_COMMAND} -S "${_prewarm_folder}/src" -B "${_prewarm_folder}/build" ${_configure_args}
+                            "-DCMAKE_PROJECT_TOP_LEVEL_INCLUDES=${CMAKE_CURRENT_FUNCTION_LIST_FILE}"
+                            -DCONAN_PROVIDER_LAZY=OFF -DCONAN_PROVIDER_PER_DIRECTORY=OFF
+                    RESULT_VARIABLE _return_code)
+    if(NOT _return_code STREQUAL "0")
+        message(FATAL_ERROR "CMake-Conan: installing the dependencies of ${_source_dir} failed")
+    endif()
+endfunction()
+
+
+# In script mode, only the dependencies are installed
+if(CMAKE_SCRIPT_MODE_FILE STREQUAL CMAKE_CURRENT_LIST_FILE)
+    conan_prewarm()
+    return()
+endif()
+
+
 cmake_language(
     SET_DEPENDENCY_PROVIDER conan_provide_dependency
     SUPPORTED_METHODS FIND_PACKAGE
 )
 
 
+function(conan_write_timings)
+    # Write the timings recorded by the provider to a JSON file, and optionally print a summary
+    get_property(_timings GLOBAL PROPERTY CONAN_PROVIDER_TIMINGS)
+    if(NOT _timings)
+        return()
+    endif()
+    set(_json "{\"phases\": []}")
+    set(_summary "")
+    set(_index 0)
+    foreach(_timing IN LISTS _timings)
+        string(REGEX MATCH "^(.*)\\|([0-9-]+)\\|([0-9-]+)$" _match "${_timing}")
+        set(_phase "{}")
+        string(JSON _phase SET "${_phase}" name "\"${CMAKE_MATCH_1}\"")
+        string(JSON _phase SET "${_phase}" start_us ${CMAKE_MATCH_2})
+        string(JSON _phase SET "${_phase}" duration_us ${CMAKE_MATCH_3})
+        string(JSON _json SET "${_json}" phases ${_index} "${_phase}")
+        math(EXPR _index "${_index} + 1")
+        math(EXPR _duration_ms "${CMAKE_MATCH_3} / 1000")
+        string(APPEND _summary "\n  ${CMAKE_MATCH_1}: ${_duration_ms} ms")
+    endforeach()
+    file(WRITE "${CMAKE_BINARY_DIR}/conan_provider_timings.json" "${_json}")
+    if(CONAN_PROVIDER_TIMING_SUMMARY)
+        message(STATUS "CMake-Conan: Timings (${CMAKE_BINARY_DIR}/conan_provider_timings.json):${_summary}")
+    endif()
+endfunction()
+
+
 macro(conan_provide_dependency_check)
+    conan_write_timings()
     set(_CONAN_PROVIDE_DEPENDENCY_INVOKED FALSE)
     get_property(_CONAN_PROVIDE_DEPENDENCY_INVOKED GLOBAL PROPERTY CONAN_PROVIDE_DEPENDENCY_INVOKED)
     if(NOT _CONAN_PROVIDE_DEPENDENCY_INVOKED)
@@ -611,14 +2331,40 @@ macro(conan_provide_dependency_check)
 endmacro()
 
 
+# Reference point for the timings recorded by the provider
+string(TIMESTAMP _conan_provider_start_time "%s%f")
+set_property(GLOBAL PROPERTY CONAN_PROVIDER_START_TIME ${_conan_provider_start_time})
+unset(_conan_provider_start_time)
+
 # Add a deferred call at the end of processing the top-level directory
-# to check if the dependency provider was invoked at all.
+# to check if the dependency provider was invoked at all, and to write the timings.
 cmake_language(DEFER DIRECTORY "${CMAKE_SOURCE_DIR}" CALL conan_provide_dependency_check)
 
 # Configurable variables for Conan profiles
 set(CONAN_HOST_PROFILE "default;auto-cmake" CACHE STRING "Conan host profile")
 set(CONAN_BUILD_PROFILE "default" CACHE STRING "Conan build profile")
 set(CONAN_INSTALL_ARGS "--build=missing" CACHE STRING "Command line arguments for conan install")
+set(CONAN_REQUIRES "" CACHE STRING "Requirements installed with Conan when the project has no conanfile, e.g. fmt/10.0.0;zlib/1.3")
+set(CONAN_INSTALL_CONFIGURATIONS "" CACHE STRING "Build types installed for multi-configuration generators (default: Release;Debug)")
+option(CONAN_PROVIDER_TIMING_SUMMARY "Print a summary of the time spent by the Conan dependency provider" OFF)
+option(CONAN_SKIP_VERSION_CHECK "Do not check the version of the Conan executable" OFF)
+set(CONAN_LOCKFILE "" CACHE FILEPATH "Conan lockfile (default: conan.lock next to the conanfile, if it exists)")
+option(CONAN_LOCKFILE_PARTIAL "Allow requirements that are not in the Conan lockfile" OFF)
+option(CONAN_LOCKFILE_UPDATE "Create or update the Conan lockfile on conan install" OFF)
+set(CONAN_PROVIDER_OFFLINE "OFF" CACHE STRING "Use the Conan remotes in conan install: OFF (always), ON (never), AUTO (only for packages missing from the cache)")
+set_property(CACHE CONAN_PROVIDER_OFFLINE PROPERTY STRINGS OFF ON AUTO)
+option(CONAN_PROVIDER_PER_DIRECTORY "Install the conanfile closest to the directory of each find_package() call" OFF)
+option(CONAN_PROVIDER_LAZY "Only run conan install when a package provided by Conan is searched for" OFF)
+set(CONAN_PROVIDED_PACKAGES "" CACHE STRING "Names of the packages provided by Conan, for CONAN_PROVIDER_LAZY (default: the names found by a previous install)")
+set(CONAN_PROVIDER_SHARED_CACHE "" CACHE PATH "Folder where build trees with the same inputs share the results of conan install")
+set(CONAN_PROVIDER_SHARED_CACHE_MAX_ENTRIES "20" CACHE STRING "Maximum number of entries kept in CONAN_PROVIDER_SHARED_CACHE")
+set(CONAN_PROVIDER_SHARED_CACHE_MAX_AGE "30" CACHE STRING "Days after which unused entries are removed from CONAN_PROVIDER_SHARED_CACHE")
+option(CONAN_PROVIDER_SINGLE_PROCESS "Check the version, detect the default profile and run all the installs in a single Conan process" OFF)
+option(CONAN_INSTALL_PER_BUILD_TYPE "Keep the results of conan install of each build type in a subfolder, for single-configuration generators" OFF)
+set(CONAN_PREINSTALL_BUILD_TYPES "" CACHE STRING "Build types installed in the background after the one of CMAKE_BUILD_TYPE, with CONAN_INSTALL_PER_BUILD_TYPE, e.g. Debug;Release")
+set(CONAN_TOOLCHAIN_VARIABLES "CMAKE_C_COMPILER_LAUNCHER;CMAKE_CXX_COMPILER_LAUNCHER" CACHE STRING "CMake variables passed to the dependencies built from source, e.g. CMAKE_C_COMPILER_LAUNCHER")
+option(CONAN_INSTALL_PARALLEL "Run conan install for all the configurations of multi-configuration generators in parallel" OFF)
+option(CONAN_PROVIDER_PREFETCH "Resolve the dependency graph and download what doesn't depend on the compiler in the background, while project() detects the compilers" OFF)
 
 find_program(_cmake_program NAMES cmake NO_PACKAGE_ROOT_PATH NO_CMAKE_PATH NO_CMAKE_ENVIRONMENT_PATH NO_CMAKE_SYSTEM_PATH NO_CMAKE_FIND_ROOT_PATH)
 if(NOT _cmake_program)
@@ -626,3 +2372,7 @@ if(NOT _cmake_program)
     set(PATH_TO_CMAKE_BIN "${PATH_TO_CMAKE_BIN}" CACHE INTERNAL "Path where the CMake executable is")
 endif()
 
+# Overlap the downloads of Conan with the detection of the compilers by project()
+if(CONAN_PROVIDER_PREFETCH)
+    conan_prefetch_start()
+endif()
@@ -0,0 +1,162 @@
+"""Fixtures and helpers shared by the test modules: the Conan home of the test process,
+the environment the commands are run with, and the CMake projects of the tests."""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+src_dir = Path(__file__).parent.parent
+conan_provider = src_dir / "conan_provider.cmake"
+resources_dir= src_dir / 'tests' / 'resources'
+# Binaries of the test recipes kept between runs, see create_conan_home_template
+binary_cache_dir = Path(os.environ.get("CMAKE_CONAN_TEST_BINARY_CACHE",
+                                       Path(tempfile.gettempdir()) / "cmake-conan-test-binaries"))
+
+# Version of the Conan executable the tests run with, e.g. (2, 4, 1)
+conan_version = tuple(int(part) for part in re.findall(
+    r"\d+", subprocess.run("conan --version", shell=True, check=True, capture_output=True, text=True).stdout)[:3])
+
+
+# Environment of the commands run by the tests: CONAN_HOME is set to the Conan home
+# of the current test process by the setup_conan_home fixture
+run_env = dict(os.environ)
+
+
+def run(cmd, check=True, cwd=None):
+    subprocess.run(cmd, shell=True, check=check, cwd=cwd, env=run_env)
+
+
+def binary_cache_key(conan_home, recipes_dir):
+    "Hash of everything the binaries of the test recipes depend on"
+    key = hashlib.sha256()
+    key.update(subprocess.run("conan --version", shell=True, check=True, capture_output=True).stdout)
+    key.update((conan_home / "profiles" / "default").read_bytes())
+    for recipe_file in sorted(path for path in recipes_dir.rglob("*") if path.is_file()):
+        key.update(recipe_file.relative_to(recipes_dir).as_posix().encode())
+        key.update(recipe_file.read_bytes())
+    return key.hexdigest()[:16]
+
+
+def create_conan_home_template(conan_home, workdir):
+    "Set up profiles in a Conan home, export the recipes common to tests and build their binaries."
+    logging.info(f"Initializing Conan settings in: {conan_home}")
+    env = dict(os.environ, CONAN_HOME=conan_home.as_posix())
+
+    def conan(args, cwd=None):
+        subprocess.run(f"conan {args}", shell=True, check=True, cwd=cwd, env=env)
+
+    # Detect default profile
+    conan("profile detect -vquiet")
+
+    # Create hello lib from built-in CMake template
+    recipe_dir = workdir / "hello"
+    recipe_dir.mkdir()
+    conan("new cmake_lib -d name=hello -d version=0.1 -vquiet", cwd=recipe_dir)
+    conan("export . -vquiet", cwd=recipe_dir)
+
+    # Create hello-autootols from built-in autotools template
+    recipe_dir = workdir / "helloautotools"
+    recipe_dir.mkdir()
+    conan("new autotools_lib -d name=helloautotools -d version=0.1 -vquiet", cwd=recipe_dir)
+    conan("export . -vquiet", cwd=recipe_dir)
+
+    # additional recipes to export from resources, overlay on top of `hello` and export
+    additional_recipes = ['boost', 'bye', 'cmake-module-only', 'cmake-module-with-dependency']
+
+    for recipe in additional_recipes:
+        recipe_dir = workdir / recipe
+        recipe_dir.mkdir()
+        conan(f"new cmake_lib -d name={recipe} -d version=0.1 -f -vquiet", cwd=recipe_dir)
+        shutil.copy2(src_dir / 'tests' / 'resources' / 'recipes' / recipe / 'conanfile.py', recipe_dir)
+        conan("export . -vquiet", cwd=recipe_dir)
+
+    # Binaries of the packages used by most tests, as the projects in resources build them.
+    # They are restored from the binary cache when they were built by a previous run with
+    # the same Conan version, default profile and recipes, and saved to it otherwise.
+    # Their recipes are only in the cache, so the remotes are not needed
+    archive = binary_cache_dir / f"{binary_cache_key(conan_home, workdir)}.tgz"
+    if archive.exists():
+        logging.info(f"Restoring the binaries of the test recipes from {archive}")
+        conan(f"cache restore {archive} -vquiet")
+    for build_type in ["Release", "Debug"]:
+        conan(f"install --requires=hello/0.1 --requires=bye/0.1 --requires=boost/1.77.0 -s build_type={build_type} "
+              "-s compiler.cppstd=17 --build=missing --no-remote -vquiet", cwd=workdir)
+    if not archive.exists():
+        binary_cache_dir.mkdir(parents=True, exist_ok=True)
+        partial_archive = archive.with_name(f"{archive.stem}.{os.getpid()}.partial.tgz")
+        conan(f'cache save "*/*:*" --file={partial_archive} -vquiet')
+        partial_archive.replace(archive)
+
+    # Additional profiles for testing
+    config_dir = resources_dir / 'custom_config'
+    conan(f"config install {config_dir}")
+
+
+@pytest.fixture(scope="session")
+def conan_home_dir(tmp_path_factory):
+    """Set up the CONAN_HOME of the test process in a temporary directory, as a copy
+    of a template Conan home. With pytest-xdist, the template is created once, by
+    the first worker that needs it, and shared by all the workers.
+    """
+    base_dir = tmp_path_factory.getbasetemp()
+    if os.environ.get("PYTEST_XDIST_WORKER"):
+        base_dir = base_dir.parent
+    template = base_dir / "conan_home_template"
+    lock = base_dir / "conan_home_template.lock"
+    try:
+        lock.mkdir()
+    except FileExistsError:
+        logging.info(f"Waiting for the template Conan home: {template}")
+        while not template.exists():
+            if (lock / "failed").exists():
+                pytest.fail("The creation of the template Conan home failed in another worker")
+            time.sleep(1)
+    else:
+        partial_template = base_dir / "conan_home_template.partial"
+        try:
+            create_conan_home_template(partial_template, tmp_path_factory.mktemp("temp_recipes"))
+        except Exception:
+            (lock / "failed").touch()
+            raise
+        partial_template.rename(template)
+
+    conan_home = tmp_path_factory.mktemp("conan_home")
+    shutil.copytree(template, conan_home, dirs_exist_ok=True)
+    logging.info(f"CONAN_HOME set to: {conan_home}")
+    return conan_home
+
+
+@pytest.fixture(scope="session", autouse=True)
+def setup_conan_home(conan_home_dir):
+    "Run the commands of the tests with the Conan home of the test process."
+    run_env["CONAN_HOME"] = conan_home_dir.as_posix()
+    yield
+    del run_env["CONAN_HOME"]
+
+
+def setup_cmake_workdir(base_tmp_dir, resource_dirs=['basic_cmake']):
+    source_dir = base_tmp_dir / "src"
+    binary_dir = base_tmp_dir / "build"
+    source_dir.mkdir()
+    binary_dir.mkdir()
+    for item in resource_dirs:
+        shutil.copytree(resources_dir / item, source_dir.as_posix(), dirs_exist_ok=True)
+    return (source_dir, binary_dir)
+
+@pytest.fixture
+def basic_cmake_project(tmp_path):
+    """ Function scope fixture that creates a temporary
+    directory, copy the needed resources to it, and then
+    create a build directory
+    """
+    workdir = tmp_path / "test_workdir"
+    workdir.mkdir()
+    source_dir, binary_dir = setup_cmake_workdir(workdir)
+    yield (source_dir, binary_dir)
@@ -0,0 +1,136 @@
+"""Benchmarks of the time spent configuring projects with the dependency provider.
+
+They are skipped unless CMAKE_CONAN_BENCHMARK is set to the JSON file the results
+are written to, e.g.:
+
+    CMAKE_CONAN_BENCHMARK=benchmark.json pytest test_benchmark.py
+
+Each benchmark runs CMAKE_CONAN_BENCHMARK_ROUNDS times (default: 3), after a first
+untimed run that populates the Conan cache, so that no package is built from source
+in the timed runs. Besides the wall-clock time of each configure, the results include
+the mean duration of the phases recorded by the provider in conan_provider_timings.json,
+e.g. each of the detect_* functions, conan install and find_package() calls.
+"""
+import json
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from conftest import conan_provider, run_env, setup_cmake_workdir
+
+benchmark_output = os.environ.get("CMAKE_CONAN_BENCHMARK")
+rounds = int(os.environ.get("CMAKE_CONAN_BENCHMARK_ROUNDS", "3"))
+
+pytestmark = pytest.mark.skipif(not benchmark_output, reason="Set CMAKE_CONAN_BENCHMARK to the results file to run the benchmarks")
+
+results = []
+
+synthetic_recipe = """
+from conan import ConanFile
+
+class SyntheticConan(ConanFile):
+    version = "1.0"
+    package_type = "header-library"
+
+    def package_info(self):
+        self.cpp_info.bindirs = []
+        self.cpp_info.libdirs = []
+"""
+
+
+@pytest.fixture(scope="module", autouse=True)
+def benchmark_report():
+    yield
+    Path(benchmark_output).write_text(json.dumps({"rounds": rounds, "benchmarks": results}, indent=2))
+
+
+def configure(source_dir, binary_dir, *args):
+    "Configure the project, returning the wall-clock time and the timings recorded by the provider"
+    start = time.perf_counter()
+    subprocess.run(["cmake", "-S", source_dir.as_posix(), "-B", binary_dir.as_posix(),
+                    f"-DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider.as_posix()}", *args],
+                   check=True, stdout=subprocess.DEVNULL, env=run_env)
+    elapsed = time.perf_counter() - start
+    timings = json.loads((binary_dir / "conan_provider_timings.json").read_text())
+    phases = {}
+    for phase in timings["phases"]:
+        phases[phase["name"]] = phases.get(phase["name"], 0) + phase["duration_us"]
+    return elapsed, phases
+
+
+def record(name, measurements):
+    durations = [elapsed for elapsed, _ in measurements]
+    phase_names = {phase for _, phases in measurements for phase in phases}
+    results.append({
+        "name": name,
+        "min_s": min(durations),
+        "mean_s": sum(durations) / len(durations),
+        "max_s": max(durations),
+        "phases_mean_us": {phase: sum(phases.get(phase, 0) for _, phases in measurements) // len(measurements)
+                           for phase in sorted(phase_names)},
+    })
+
+
+def cold_configures(source_dir, workdir, *args):
+    "Configure fresh build folders, after a first untimed one that populates the Conan cache"
+    configure(source_dir, workdir / "build-warmup", *args)
+    return [configure(source_dir, workdir / f"build-{i}", *args) for i in range(rounds)]
+
+
+def warm_reconfigures(source_dir, binary_dir, *args):
+    configure(source_dir, binary_dir, *args)
+    return [configure(source_dir, binary_dir) for _ in range(rounds)]
+
+
+@pytest.fixture(scope="module")
+def synthetic_recipes(tmp_path_factory):
+    "Export the recipes of the synthetic packages, as many as the largest benchmark needs"
+    recipe_dir = tmp_path_factory.mktemp("synthetic_recipe")
+    (recipe_dir / "conanfile.py").write_text(synthetic_recipe)
+    exported = 0
+
+    def export(count):
+        nonlocal exported
+        for i in range(exported, count):
+            subprocess.run(["conan", "export", recipe_dir.as_posix(), f"--name=synth{i}", "-vquiet"], check=True, env=run_env)
+        exported = max(exported, count)
+    return export
+
+
+def synthetic_project(workdir, count):
+    source_dir = workdir / "src"
+    source_dir.mkdir()
+    (source_dir / "conanfile.txt").write_text("[requires]\n" + "".join(f"synth{i}/1.0\n" for i in range(count)))
+    (source_dir / "CMakeLists.txt").write_text(
+        "cmake_minimum_required(VERSION 3.24)\n"
+        "project(Synthetic CXX)\n"
+        f"foreach(i RANGE {count - 1})\n"
+        "    find_package(synth${i} REQUIRED)\n"
+        "endforeach()\n")
+    return source_dir
+
+
+class TestBenchmark:
+    def test_cold_configure(self, tmp_path):
+        source_dir, _ = setup_cmake_workdir(tmp_path)
+        record("cold_configure", cold_configures(source_dir, tmp_path, "-DCMAKE_BUILD_TYPE=Release"))
+
+    def test_warm_reconfigure(self, tmp_path):
+        source_dir, binary_dir = setup_cmake_workdir(tmp_path)
+        record("warm_reconfigure", warm_reconfigures(source_dir, binary_dir, "-DCMAKE_BUILD_TYPE=Release"))
+
+    @pytest.mark.skipif(shutil.which("ninja") is None, reason="Ninja is required for the multi-config generator")
+    def test_multi_config_configure(self, tmp_path):
+        source_dir, _ = setup_cmake_workdir(tmp_path)
+        record("multi_config_configure", cold_configures(source_dir, tmp_path, "-GNinja Multi-Config"))
+
+    @pytest.mark.parametrize("count", [10, 100, 500])
+    def test_synthetic_packages(self, tmp_path, synthetic_recipes, count):
+        synthetic_recipes(count)
+        source_dir = synthetic_project(tmp_path, count)
+        record(f"cold_configure_{count}_packages", cold_configures(source_dir, tmp_path, "-DCMAKE_BUILD_TYPE=Release"))
+        record(f"warm_reconfigure_{count}_packages", warm_reconfigures(source_dir, tmp_path / "build-0"))
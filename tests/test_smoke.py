@@ -1,13 +1,15 @@
-import logging
+import json
 import os
 import platform
 import re
 import shutil
-import subprocess
-from pathlib import Path
+import textwrap
+import time
 
 import pytest
 
+from conftest import conan_provider, conan_version, resources_dir, run, setup_cmake_workdir, src_dir
+
 expected_conan_install_outputs = [
     "first find_package() found. Installing dependencies with Conan",
     "found, 'conan install' already ran"
@@ -23,92 +25,12 @@ expected_app_msvc_runtime = [
     "bye/0.1: MSVC runtime: {expected_runtime}"
 ]
 
-src_dir = Path(__file__).parent.parent
-conan_provider = src_dir / "conan_provider.cmake"
-resources_dir= src_dir / 'tests' / 'resources'
-
 unix = pytest.mark.skipif(platform.system() != "Linux" and platform.system() != "Darwin", reason="Linux or Darwin only")
 linux = pytest.mark.skipif(platform.system() != "Linux", reason="Linux only")
 darwin = pytest.mark.skipif(platform.system() != "Darwin", reason="Darwin only")
 windows = pytest.mark.skipif(platform.system() != "Windows", reason="Windows only")
-
-
-def run(cmd, check=True):
-    subprocess.run(cmd, shell=True, check=check)
-
-
-@pytest.fixture(scope="session")
-def conan_home_dir(tmp_path_factory):
-    """Set up the CONAN_HOME in a temporary directory,
-    common to all the tests in the file
-    """
-    conan_home = tmp_path_factory.mktemp("conan_home")
-    old_env = dict(os.environ)
-    os.environ.update({"CONAN_HOME": conan_home.as_posix()})
-    logging.info(f"CONAN_HOME set to: {conan_home}")
-    yield conan_home
-    os.environ.clear()
-    os.environ.update(old_env)
-
-
-@pytest.fixture(scope="session", autouse=True)
-def setup_conan_home(conan_home_dir, tmp_path_factory):
-    "Set up profiles in Conan Cache, and export recipes common to tests."
-    logging.info(f"Initializing Conan settings in: {conan_home_dir}")
-    workdir = tmp_path_factory.mktemp("temp_recipes")
-    logging.info(f"Conan home setup, temporary folder: {workdir}")
-    cwd = os.getcwd()
-    
-    # Detect default profile
-    run("conan profile detect -vquiet")
-    
-    # Create hello lib from built-in CMake template
-    os.chdir(workdir.as_posix())
-    run("conan new cmake_lib -d name=hello -d version=0.1 -vquiet")
-    run("conan export . -vquiet")
-
-    # Create hello-autootols from built-in autotools template
-    recipe_dir = tmp_path_factory.mktemp(f"temp_autotools")
-    os.chdir(recipe_dir.as_posix())
-    run("conan new autotools_lib -d name=helloautotools -d version=0.1 -vquiet")
-    run("conan export . -vquiet")
-
-    # additional recipes to export from resources, overlay on top of `hello` and export
-    additional_recipes = ['boost', 'bye', 'cmake-module-only', 'cmake-module-with-dependency']
-
-    for recipe in additional_recipes:
-        recipe_dir = tmp_path_factory.mktemp(f"temp_{recipe}")
-        os.chdir(recipe_dir.as_posix())
-        run(f"conan new cmake_lib -d name={recipe} -d version=0.1 -f -vquiet")
-        shutil.copy2(src_dir / 'tests' / 'resources' / 'recipes' / recipe / 'conanfile.py', ".")
-        run("conan export . -vquiet")
-
-    # Additional profiles for testing
-    config_dir = resources_dir / 'custom_config'
-    run(f"conan config install {config_dir}")
-    os.chdir(cwd)
-
-
-def setup_cmake_workdir(base_tmp_dir, resource_dirs=['basic_cmake']):
-    source_dir = base_tmp_dir / "src"
-    binary_dir = base_tmp_dir / "build"
-    source_dir.mkdir()
-    binary_dir.mkdir()
-    for item in resource_dirs:
-        shutil.copytree(resources_dir / item, source_dir.as_posix(), dirs_exist_ok=True)
-    return (source_dir, binary_dir)
-
-@pytest.fixture
-def basic_cmake_project(tmp_path, monkeypatch):
-    """ Function scope fixture that creates a temporary
-    directory, copy the needed resources to it, and then
-    create a build directory and chdir to it
-    """
-    workdir = tmp_path / "test_workdir"
-    workdir.mkdir()
-    source_dir, binary_dir = setup_cmake_workdir(workdir)
-    monkeypatch.chdir(binary_dir)
-    yield (source_dir, binary_dir)
+# tools.cmake.cmaketoolchain:extra_variables
+conan_2_4 = pytest.mark.skipif(conan_version < (2, 4, 0), reason="Conan 2.4.0 or later only")
 
 
 class TestBasic:
@@ -122,14 +44,6 @@ class TestBasic:
         TestBasic.source_dir = source_dir
         TestBasic.binary_dir = binary_dir
         TestBasic.binary_dir_multi = binary_dir_multi
-        cwd = os.getcwd()
-        os.chdir(binary_dir.as_posix())
-        yield
-        os.chdir(cwd)
-
-    @pytest.fixture
-    def build_dir_multi(self, monkeypatch):
-        monkeypatch.chdir(self.binary_dir_multi)
 
     def test_single_config(self, capfd):
         "Conan installs once during configure and applications are created"
@@ -138,16 +52,15 @@ class TestBasic:
         run(f"cmake -S {self.source_dir} -B {self.binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release {generator}")
         out, _ = capfd.readouterr()
         assert all(expected in out for expected in expected_conan_install_outputs)
-        run("cmake --build .")
+        run(f"cmake --build {self.binary_dir}")
         out, _ = capfd.readouterr()
         assert all(expected not in out for expected in expected_conan_install_outputs)
         app_executable = "app.exe" if platform.system() == "Windows" else "app"
-        run(os.path.join(os.getcwd(), app_executable))
+        run(os.path.join(self.binary_dir, app_executable))
         out, _ = capfd.readouterr()
         expected_output = [f.format(config="Release") for f in expected_app_outputs]
         assert all(expected in out for expected in expected_output)
 
-    @pytest.mark.usefixtures("build_dir_multi")
     def test_multi_config(self, capfd):
         "Conan installs once during configure and applications are created"
         generator = "-G'Ninja Multi-Config'" if platform.system() != "Windows" else ""
@@ -157,8 +70,8 @@ class TestBasic:
 
         app_executable = "app.exe" if platform.system() == "Windows" else "app"
         for config in ["Release", "Debug"]:
-            run(f"cmake --build . --config {config}")
-            run(os.path.join(os.getcwd(), config, app_executable))
+            run(f"cmake --build {self.binary_dir_multi} --config {config}")
+            run(os.path.join(self.binary_dir_multi, config, app_executable))
             out, _ = capfd.readouterr()
             expected_outputs = [f.format(config=config) for f in expected_app_outputs]
             assert all(expected not in out for expected in expected_conan_install_outputs)
@@ -168,36 +81,68 @@ class TestBasic:
         "Ensure that if the generator is single config, `conan install` is only called for one configuration, "
         "even when `CMAKE_CONFIGURATION_TYPES` is set to multiple values on a single-config generator"
         generator = "-GNinja" if platform.system() == "Windows" else ""
+        # Discard the results of the previous test, otherwise they are reused as the inputs are the same
+        shutil.rmtree(self.binary_dir / "conan")
         run(f'cmake -S {self.source_dir} -B {self.binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release {generator} -DOVERRIDE_CONFIG_TYPES=ON')
         out, _ = capfd.readouterr()
         assert all(expected in out for expected in expected_conan_install_outputs)
         assert "Overriding config types" in out
         assert "CMake-Conan: Installing single configuration Release" in out
-        run("cmake --build .")
+        run(f"cmake --build {self.binary_dir}")
         out, _ = capfd.readouterr()
         assert all(expected not in out for expected in expected_conan_install_outputs)
 
         app_executable = "app.exe" if platform.system() == "Windows" else "app"
-        run(os.path.join(os.getcwd(), app_executable))
+        run(os.path.join(self.binary_dir, app_executable))
         out, _ = capfd.readouterr()
         expected_output = [f.format(config="Release") for f in expected_app_outputs]
         assert all(expected in out for expected in expected_output)
 
+    @unix
+    def test_reconfigure_unchanged_inputs(self, capfd):
+        "Touching the conanfile triggers a reconfigure, but conan install is skipped as the inputs did not change"
+        run(f"cmake --build {self.binary_dir}")
+        out, _ = capfd.readouterr()
+        assert all(expected not in out for expected in expected_conan_install_outputs)
+        p = self.source_dir / "conanfile.txt"
+        p.touch()
+        run(f"cmake --build {self.binary_dir}")
+        out, _ = capfd.readouterr()
+        assert all(expected in out for expected in expected_conan_install_outputs)
+        assert "inputs unchanged since last 'conan install', reusing" in out
+        assert "CMake-Conan: Installing single configuration" not in out
+
     @unix
     def test_reconfigure_on_conanfile_changes(self, capfd):
         "A conanfile change triggers conan install"
-        run("cmake --build .")
+        run(f"cmake --build {self.binary_dir}")
         out, _ = capfd.readouterr()
         assert all(expected not in out for expected in expected_conan_install_outputs)
         p = self.source_dir / "conanfile.txt"
-        p.touch()
-        run("cmake --build .")
+        p.write_text(p.read_text() + "\n[options]\nhello/*:shared=True\n")
+        run(f"cmake --build {self.binary_dir}")
         out, _ = capfd.readouterr()
         assert all(expected in out for expected in expected_conan_install_outputs)
+        assert "CMake-Conan: Installing single configuration" in out
+        assert "inputs unchanged since last 'conan install'" not in out
+
+
+    def test_reconfigure_removed_packages(self, capfd, basic_cmake_project):
+        "conan install runs again if the packages of the previous install are gone from the Conan cache"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        # As if the package had been removed, without touching the shared Conan cache of the tests
+        data_file = next((binary_dir / "conan").rglob("hello-release-*-data.cmake"))
+        data_file.write_text(re.sub(r'(hello_PACKAGE_FOLDER_RELEASE ")[^"]*"', r'\1/removed/hello/p"', data_file.read_text()))
+        capfd.readouterr()
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "package folder /removed/hello/p no longer exists" in out
+        assert "CMake-Conan: Installing single configuration" in out
+        run(f"cmake --build {binary_dir}")
 
 
     @windows
-    @pytest.mark.usefixtures("build_dir_multi")
     @pytest.mark.parametrize("msvc_runtime", ["MultiThreaded$<$<CONFIG:Debug>:Debug>",
                                               "MultiThreaded$<$<CONFIG:Debug>:Debug>DLL",
                                               "MultiThreaded", "MultiThreadedDebugDLL"])
@@ -209,8 +154,8 @@ class TestBasic:
 
         app_executable = "app.exe" if platform.system() == "Windows" else "app"
         for config in ["Release", "Debug"]:
-            run(f"cmake --build . --config {config}")
-            run(os.path.join(os.getcwd(), config, app_executable))
+            run(f"cmake --build {self.binary_dir_multi} --config {config}")
+            run(os.path.join(self.binary_dir_multi, config, app_executable))
             out, _ = capfd.readouterr()
             expected_outputs = [f.format(config=config) for f in expected_app_outputs]
             assert all(expected not in out for expected in expected_conan_install_outputs)
@@ -231,10 +176,10 @@ class TestBasic:
         run(f"cmake -S {self.source_dir} -B {self.binary_dir} -GNinja -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE={config} {msvc_runtime_flag} -GNinja")
         out, _ = capfd.readouterr()
         assert all(expected in out for expected in expected_conan_install_outputs)
-        run("cmake --build .")
+        run(f"cmake --build {self.binary_dir}")
         out, _ = capfd.readouterr()
         assert all(expected not in out for expected in expected_conan_install_outputs)
-        run(os.path.join(os.getcwd(), "app.exe"))
+        run(os.path.join(self.binary_dir, "app.exe"))
         out, _ = capfd.readouterr()
         expected_output = [f.format(config=config) for f in expected_app_outputs]
         assert all(expected in out for expected in expected_output)
@@ -244,6 +189,163 @@ class TestBasic:
         expected_runtime_outputs = [f.format(expected_runtime=runtime) for f in expected_app_msvc_runtime]
         assert all(expected in out for expected in expected_runtime_outputs)
         
+class TestInstallConfigurations:
+    def test_multi_config_parallel(self, capfd, basic_cmake_project):
+        "All the configurations of a multi-config generator are installed by concurrent conan install processes"
+        source_dir, binary_dir = basic_cmake_project
+        generator = "-G'Ninja Multi-Config'" if platform.system() != "Windows" else ""
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} {generator} '
+            '-DCONAN_INSTALL_PARALLEL=ON -DCONAN_INSTALL_CONFIGURATIONS="Release;Debug;RelWithDebInfo"')
+        out, _ = capfd.readouterr()
+        assert all(expected in out for expected in expected_conan_install_outputs)
+        assert "Installing configurations Release;Debug;RelWithDebInfo in parallel" in out
+        for config in ["Release", "Debug", "RelWithDebInfo"]:
+            assert (binary_dir / "conan" / f"conan_install_{config}.json").exists()
+
+        app_executable = "app.exe" if platform.system() == "Windows" else "app"
+        for config in ["Release", "Debug", "RelWithDebInfo"]:
+            run(f"cmake --build {binary_dir} --config {config}")
+            run(os.path.join(binary_dir, config, app_executable))
+            out, _ = capfd.readouterr()
+            # NDEBUG is defined for RelWithDebInfo, the libraries report a Release build
+            expected_config = "Debug" if config == "Debug" else "Release"
+            assert all(expected in out for expected in [f.format(config=expected_config) for f in expected_app_outputs])
+
+    def test_multi_config_parallel_failure(self, capfd, basic_cmake_project):
+        "A failure in one of the configurations is reported"
+        source_dir, binary_dir = basic_cmake_project
+        generator = "-G'Ninja Multi-Config'" if platform.system() != "Windows" else ""
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} {generator} '
+            '-DCONAN_INSTALL_PARALLEL=ON -DCONAN_INSTALL_CONFIGURATIONS="Release;Unknown"', check=False)
+        _, err = capfd.readouterr()
+        assert "Conan install failed for configuration(s):" in err
+        assert "Unknown: exit code 1" in err
+        assert "Release: exit code" not in err
+
+
+class TestConanfileChanges:
+    conanfile_py = textwrap.dedent("""
+        from conan import ConanFile
+
+        class App(ConanFile):
+            settings = "os", "arch", "compiler", "build_type"
+            generators = "CMakeDeps"
+
+            def requirements(self):
+                self.requires("hello/0.1")
+                self.requires("bye/0.1")
+                self.requires("boost/1.77.0")
+
+            def package(self):
+                pass
+        """)
+
+    @pytest.fixture
+    def configured_project(self, capfd, basic_cmake_project):
+        source_dir, binary_dir = basic_cmake_project
+        (source_dir / "conanfile.txt").unlink()
+        conanfile = source_dir / "conanfile.py"
+        conanfile.write_text(self.conanfile_py)
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Installing single configuration Release" in out
+        yield conanfile, binary_dir
+
+    @unix
+    def test_comment_changes(self, capfd, configured_project):
+        "Comment and whitespace edits of the conanfile don't trigger conan install"
+        conanfile, binary_dir = configured_project
+        conanfile.write_text("# The dependencies of the app\n\n" +
+                             conanfile.read_text().replace("def package(self):", "def package(self):   \n        # Nothing to package\n"))
+        run(f"cmake --build {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "inputs unchanged since last 'conan install', reusing" in out
+        assert "checking its dependency graph" not in out
+        assert "CMake-Conan: Installing single configuration" not in out
+
+    @unix
+    def test_changes_outside_of_the_graph(self, capfd, configured_project):
+        "Changes of a conanfile.py that don't affect its dependency graph don't trigger conan install"
+        conanfile, binary_dir = configured_project
+        conanfile.write_text(conanfile.read_text().replace("pass", 'self.output.info("packaging")'))
+        run(f"cmake --build {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "checking its dependency graph" in out
+        assert "don't affect 'conan install'" in out
+        assert "inputs unchanged since last 'conan install', reusing" in out
+        assert "CMake-Conan: Installing single configuration" not in out
+
+        # The stamp was updated, the graph is not checked again
+        run(f"cmake -S {conanfile.parent} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "checking its dependency graph" not in out
+        assert "inputs unchanged since last 'conan install', reusing" in out
+
+    @unix
+    @pytest.mark.parametrize("change", [('self.requires("boost/1.77.0")', ""),
+                                        ("pass", "pass\n\n    def generate(self):\n        pass"),
+                                        ('generators = "CMakeDeps"', 'generators = "CMakeDeps"\n    default_options = {"hello/*:shared": True}'),
+                                        ('"os", "arch", "compiler", "build_type"', '"os", "arch", "build_type"'),
+                                        ("    def package(self):", "    def _helper(self):\n        return 1\n\n    def package(self):")])
+    def test_changes_of_the_install(self, capfd, configured_project, change):
+        "Changes of the requirements, generate(), other methods, the options of dependencies or the settings trigger conan install"
+        conanfile, binary_dir = configured_project
+        conanfile.write_text(conanfile.read_text().replace(*change))
+        run(f"cmake --build {binary_dir}", check=False)
+        out, _ = capfd.readouterr()
+        assert "checking its dependency graph" in out
+        assert "CMake-Conan: Installing single configuration Release" in out
+
+
+class TestBuildTypeFolders:
+    @unix
+    def test_switch_build_type(self, capfd, basic_cmake_project):
+        "Each build type is installed in its own folder, the other ones in the background"
+        source_dir, binary_dir = basic_cmake_project
+        query_script = source_dir / "query.cmake"
+        query_script.write_text(textwrap.dedent("""
+            function(query_conan_packages)
+                get_property(_packages GLOBAL PROPERTY CONAN_INSTALLED_PACKAGES)
+                string(TOUPPER "${CMAKE_BUILD_TYPE}" _config)
+                get_property(_package_folder GLOBAL PROPERTY CONAN_PACKAGE_hello_PACKAGE_FOLDER_${_config})
+                message(STATUS "Installed packages: ${_packages}, hello in: ${_package_folder}")
+            endfunction()
+            cmake_language(DEFER DIRECTORY ${CMAKE_SOURCE_DIR} CALL query_conan_packages)
+            """))
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES="{conan_provider};{query_script}" -DCMAKE_BUILD_TYPE=Release '
+            '-DCONAN_INSTALL_PER_BUILD_TYPE=ON -DCONAN_PREINSTALL_BUILD_TYPES="Release;Debug"')
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Installing single configuration Release" in out
+        assert "installing Debug in the background" in out
+        assert (binary_dir / "conan" / "Release" / "conan_install_Release.json").exists()
+
+        # Wait for the background install
+        deadline = time.time() + 300
+        while not (binary_dir / "conan" / "Debug" / "conan_preinstall_hash").exists():
+            assert time.time() < deadline, (binary_dir / "conan" / "Debug" / "conan_preinstall.log").read_text()
+            time.sleep(1)
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_BUILD_TYPE=Debug")
+        out, _ = capfd.readouterr()
+        assert "using the background install of Debug" in out
+        assert "CMake-Conan: Installing single configuration" not in out
+        # The package index written by the background install is loaded
+        assert re.search(r"Installed packages: hello;bye;boost, hello in: .*/p\n", out)
+        assert (binary_dir / "conan" / "Debug" / "conan_packages_Debug.cmake").exists()
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert f"inputs unchanged since last 'conan install', reusing {(binary_dir / 'conan' / 'Release').as_posix()}" in out
+        assert "in the background" not in out
+
+        for config in ["Release", "Debug"]:
+            run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_BUILD_TYPE={config}")
+            run(f"cmake --build {binary_dir}")
+            run(os.path.join(binary_dir, "app"))
+            out, _ = capfd.readouterr()
+            assert "CMake-Conan: Installing single configuration" not in out
+            assert all(expected in out for expected in [f.format(config=config) for f in expected_app_outputs])
+
+
 class TestFindModules:
     def test_find_module(self, capfd, basic_cmake_project):
         "Ensure that a call to find_package(XXX MODULE REQUIRED) is honoured by the dependency provider"
@@ -254,7 +356,7 @@ class TestFindModules:
         out, err = capfd.readouterr()
         assert "Conan: Target declared 'hello::hello'" in out
         assert "Conan: Target declared 'bye::bye'" in out
-        run("cmake --build .")
+        run(f"cmake --build {binary_dir}")
 
     @pytest.mark.parametrize("use_find_components", [True, False])
     def test_find_builtin_module(self, capfd, use_find_components, basic_cmake_project):
@@ -266,7 +368,41 @@ class TestFindModules:
         run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -D_TEST_BOOST_FIND_COMPONENTS={boost_find_components}", check=False)
         out, err = capfd.readouterr()
         assert "Conan: Target declared 'Boost::boost'" in out
-        run("cmake --build .")
+        run(f"cmake --build {binary_dir}")
+
+    def test_find_package_index(self, capfd, basic_cmake_project):
+        "Ensure that the files provided by Conan are indexed and reused on re-configure"
+        source_dir, binary_dir = basic_cmake_project
+        shutil.copytree(resources_dir / 'find_module' / 'builtin_module', source_dir, dirs_exist_ok=True)
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        index = (binary_dir / "conan" / "conan_find_package_index.cmake").read_text()
+        assert "CONAN_FIND_PACKAGE_CONFIG_boost" in index and "BoostConfig.cmake" in index
+        assert "CONAN_FIND_PACKAGE_CONFIG_hello" in index and "hello-config.cmake" in index
+        assert "CONAN_FIND_PACKAGE_MODULE_bye" in index and "Findbye.cmake" in index
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "reusing" in out
+        assert "Conan: Target declared 'Boost::boost'" in out
+        run(f"cmake --build {binary_dir}")
+
+    def test_find_package_index_fallback(self, capfd, basic_cmake_project):
+        "Ensure that a package is searched for as usual when its indexed config file is wrong"
+        source_dir, binary_dir = basic_cmake_project
+        shutil.copytree(resources_dir / 'find_module' / 'builtin_module', source_dir, dirs_exist_ok=True)
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        index_file = binary_dir / "conan" / "conan_find_package_index.cmake"
+        index = index_file.read_text()
+        index = re.sub(r"(CONAN_FIND_PACKAGE_CONFIG_hello\|[^]]*\]==\] \[==\[)[^]]*", r"\1/removed/hello-config.cmake", index)
+        index_file.write_text(index)
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "reusing" in out
+        assert "Conan: Target declared 'hello::hello'" in out
+        run(f"cmake --build {binary_dir}")
 
     def test_cmake_builtin_module(self, capfd, basic_cmake_project):
         "Ensure that the Find<PackageName>.cmake modules from the CMake install work"
@@ -330,6 +466,66 @@ class TestGeneratedProfile:
         assert "The C compiler is not defined." not in err
         assert 'tools.build:compiler_executables={"c":"/usr/bin/clang","cpp":"/usr/bin/clang++"}' in out
 
+    def test_profile_written_when_changed(self, capfd, basic_cmake_project):
+        """The generated profile is only written when its contents change"""
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Creating profile" in out
+        profile = binary_dir / "conan_host_profile"
+        mtime = profile.stat().st_mtime_ns
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Creating profile" not in out
+        assert "is up to date" in out
+        assert profile.stat().st_mtime_ns == mtime
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_BUILD_TYPE=Debug")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Creating profile" in out
+        assert "build_type=Debug" in profile.read_text()
+
+    @unix
+    @conan_2_4
+    def test_propagate_parallelism_and_launchers(self, capfd, basic_cmake_project):
+        """The build parallel level and the compiler launchers are propagated to the dependencies"""
+        source_dir, binary_dir = basic_cmake_project
+        launcher = shutil.which("env")
+        run(f"CMAKE_BUILD_PARALLEL_LEVEL=3 cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} "
+            f"-DCMAKE_BUILD_TYPE=Release -DCMAKE_CXX_COMPILER_LAUNCHER={launcher}")
+        out, _ = capfd.readouterr()
+        profile = (binary_dir / "conan_host_profile").read_text()
+        assert "tools.build:jobs=3" in profile
+        assert f'tools.cmake.cmaketoolchain:extra_variables={{"CMAKE_CXX_COMPILER_LAUNCHER":"{launcher}"}}' in profile
+        assert "-- Generating done" in out
+
+        # A different number of jobs doesn't install the dependencies again
+        run(f"CMAKE_BUILD_PARALLEL_LEVEL=5 cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "tools.build:jobs=5" in (binary_dir / "conan_host_profile").read_text()
+        assert "inputs unchanged since last 'conan install'" in out
+
+    @unix
+    @conan_2_4
+    def test_escape_toolchain_variables(self, capfd, basic_cmake_project):
+        """The values of CONAN_TOOLCHAIN_VARIABLES are escaped, and only passed to Conan 2.4.0 or later"""
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} "
+            f"-DCMAKE_BUILD_TYPE=Release -DCONAN_TOOLCHAIN_VARIABLES=MY_VALUE '-DMY_VALUE=a \"b\" c:\\d'")
+        out, _ = capfd.readouterr()
+        profile = (binary_dir / "conan_host_profile").read_text()
+        assert 'tools.cmake.cmaketoolchain:extra_variables={"MY_VALUE":"a \\"b\\" c:\\\\d"}' in profile
+        assert "-- Generating done" in out
+
+        # Without the Conan version, the variables are not passed
+        shutil.rmtree(binary_dir)
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} "
+            f"-DCMAKE_BUILD_TYPE=Release -DCONAN_SKIP_VERSION_CHECK=ON -DCONAN_TOOLCHAIN_VARIABLES=MY_VALUE -DMY_VALUE=a")
+        out, _ = capfd.readouterr()
+        assert "extra_variables" not in (binary_dir / "conan_host_profile").read_text()
+        assert "CONAN_TOOLCHAIN_VARIABLES are ignored" in out
+
     @darwin
     @pytest.mark.parametrize("cmake_generator", ["Unix Makefiles", "Xcode"])
     def test_propagate_compiler_mac_autotools(self, capfd, basic_cmake_project, cmake_generator):
@@ -388,6 +584,449 @@ class TestConanInstallArgs:
         assert "--lockfile-out=" in out
         assert os.path.exists(os.path.join(binary_dir, "conan.lock"))
 
+
+class TestConanRequires:
+    def test_requires_without_conanfile(self, capfd, basic_cmake_project):
+        "Ensure that the requirements can be given in CONAN_REQUIRES instead of a conanfile"
+        source_dir, binary_dir = basic_cmake_project
+        os.remove(source_dir / "conanfile.txt")
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_REQUIRES="hello/0.1;bye/0.1"')
+        out, err = capfd.readouterr()
+        generated_conanfile = binary_dir / "conan" / "conanfile.txt"
+        assert f"conan install {generated_conanfile}" in out
+        assert "CMakeDeps generator was not defined" not in err
+        assert "hello/0.1\nbye/0.1\n" in generated_conanfile.read_text()
+        run(f"cmake --build {binary_dir}")
+
+        # Changing the requirements triggers a new install
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCONAN_REQUIRES="hello/0.1;bye/0.1;boost/1.77.0"')
+        out, _ = capfd.readouterr()
+        assert "Installing single configuration" in out
+        assert "boost/1.77.0" in generated_conanfile.read_text()
+
+
+class TestLazyInstall:
+    def test_lazy_install_system_package(self, capfd, basic_cmake_project):
+        "Ensure that conan install does not run when only packages not provided by Conan are searched for"
+        source_dir, binary_dir = basic_cmake_project
+        shutil.copytree(resources_dir / 'find_module' / 'cmake_builtin_module', source_dir, dirs_exist_ok=True)
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_LAZY=ON -DCONAN_PROVIDED_PACKAGES="hello;bye;Boost"')
+        out, _ = capfd.readouterr()
+        assert "find_package(Threads) is not provided by Conan, 'conan install' deferred" in out
+        assert "Found Threads: TRUE" in out
+        assert "Installing" not in out
+        assert not (binary_dir / "conan").exists()
+
+    def test_lazy_install_package_index(self, capfd, basic_cmake_project):
+        "Ensure that without CONAN_PROVIDED_PACKAGES, the names are taken from the index of an install newer than the conanfile"
+        source_dir, binary_dir = basic_cmake_project
+        shutil.copytree(resources_dir / 'find_module' / 'cmake_builtin_module', source_dir, dirs_exist_ok=True)
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_LAZY=ON")
+        out, _ = capfd.readouterr()
+        assert "'conan install' deferred" not in out
+        assert "Installing single configuration Release" in out
+        assert "Found Threads: TRUE" in out
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "find_package(Threads) is not provided by Conan, 'conan install' deferred" in out
+        assert "first find_package() found" not in out
+
+        # The index of the previous install may not list the packages of a new requirement
+        time.sleep(1)
+        with open(source_dir / "conanfile.txt", "a") as f:
+            f.write("\n")
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "'conan install' deferred" not in out
+        assert "first find_package() found" in out
+
+    def test_lazy_install_file_name(self, capfd, basic_cmake_project):
+        "Ensure that conan install runs for a find_package() name that differs from the names of the requirements"
+        source_dir, binary_dir = basic_cmake_project
+        (source_dir / "conanfile.txt").unlink()
+        (source_dir / "CMakeLists.txt").write_text(textwrap.dedent("""
+            cmake_minimum_required(VERSION 3.24)
+            project(MyApp CXX)
+            find_package(Orion REQUIRED)
+            """))
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_LAZY=ON -DCONAN_REQUIRES="cmake-module-only/0.1"')
+        out, _ = capfd.readouterr()
+        assert "'conan install' deferred" not in out
+        assert "Installing single configuration Release" in out
+
+    @pytest.mark.parametrize("provided_packages", ["", "hello;bye;boost"])
+    def test_lazy_install_conan_package(self, capfd, basic_cmake_project, provided_packages):
+        "Ensure that conan install runs when a package provided by Conan is searched for"
+        source_dir, binary_dir = basic_cmake_project
+        shutil.copytree(resources_dir / 'find_module' / 'builtin_module', source_dir, dirs_exist_ok=True)
+        with open(source_dir / "CMakeLists.txt", "r+") as f:
+            cmakelists = f.read()
+            f.seek(0)
+            f.write(cmakelists.replace("find_package(hello REQUIRED)", "find_package(Threads REQUIRED)\nfind_package(hello REQUIRED)"))
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_LAZY=ON -DCONAN_PROVIDED_PACKAGES="{provided_packages}"')
+        out, _ = capfd.readouterr()
+        # The names of the requirements are not used before the first install
+        assert ("find_package(Threads) is not provided by Conan, 'conan install' deferred" in out) == bool(provided_packages)
+        assert "Installing single configuration Release" in out
+        assert "Conan: Target declared 'Boost::boost'" in out
+        run(f"cmake --build {binary_dir}")
+
+
+class TestInstallGraph:
+    def test_install_graph_properties(self, capfd, basic_cmake_project):
+        "Ensure that the packages of the dependency graph can be queried from global properties"
+        source_dir, binary_dir = basic_cmake_project
+        query_script = source_dir / "query.cmake"
+        query_script.write_text(textwrap.dedent("""
+            function(query_conan_packages)
+                get_property(_packages GLOBAL PROPERTY CONAN_INSTALLED_PACKAGES)
+                message(STATUS "Installed packages: ${_packages}")
+                foreach(_field IN ITEMS BINARY INCLUDE_DIRS_RELEASE)
+                    get_property(_value GLOBAL PROPERTY CONAN_PACKAGE_hello_${_field})
+                    message(STATUS "hello ${_field}: ${_value}")
+                endforeach()
+            endfunction()
+            cmake_language(DEFER DIRECTORY ${CMAKE_SOURCE_DIR} CALL query_conan_packages)
+            """))
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES="{conan_provider};{query_script}" -DCMAKE_BUILD_TYPE=Release -DCONAN_INSTALL_ARGS="--build=missing;--build=hello/*"')
+        out, _ = capfd.readouterr()
+        assert "packages built from source: hello/0.1" in out
+        assert "Installed packages: hello;bye;boost" in out
+        assert "hello BINARY: Build" in out
+        assert re.search(r"hello INCLUDE_DIRS_RELEASE: .*/p/include", out)
+        assert (binary_dir / "conan" / "conan_packages_Release.cmake").exists()
+        install_json = json.loads((binary_dir / "conan" / "conan_install_Release.json").read_text())
+        assert any(node["ref"].startswith("hello/0.1") for node in install_json["graph"]["nodes"].values())
+
+        # The properties are also set when the results of the previous install are reused
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "reusing" in out
+        assert "Installed packages: hello;bye;boost" in out
+        assert "hello BINARY: Build" in out
+
+
+class TestSharedCache:
+    def test_shared_cache_between_build_trees(self, capfd, tmp_path, basic_cmake_project):
+        "Ensure that build trees with the same inputs reuse a single install from the shared cache"
+        source_dir, binary_dir = basic_cmake_project
+        shared_cache = tmp_path / "shared_cache"
+        other_binary_dir = tmp_path / "other_build"
+        configure = f"-DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCONAN_PROVIDER_SHARED_CACHE={shared_cache} -DCONAN_PROVIDER_SHARED_CACHE_MAX_ENTRIES=1"
+        run(f"cmake -S {source_dir} -B {binary_dir} {configure} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "Installing single configuration Release" in out
+        assert f"-of={shared_cache.as_posix()}/" in out
+        entries = [p for p in shared_cache.iterdir() if p.is_dir()]
+        assert len(entries) == 1
+
+        run(f"cmake -S {source_dir} -B {other_binary_dir} {configure} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "Installing single configuration" not in out
+        assert f"inputs unchanged since last 'conan install', reusing {entries[0].as_posix()}" in out
+        run(f"cmake --build {other_binary_dir}")
+
+        # Entries beyond CONAN_PROVIDER_SHARED_CACHE_MAX_ENTRIES are evicted
+        run(f"cmake -S {source_dir} -B {other_binary_dir} -DCMAKE_BUILD_TYPE=Debug")
+        out, _ = capfd.readouterr()
+        assert "Installing single configuration Debug" in out
+        assert f"removing {entries[0].as_posix()} from the shared cache" in out
+        assert not entries[0].exists()
+
+
+class TestConfigurePresets:
+    def test_configure_presets_in_parallel(self, capfd, tmp_path, basic_cmake_project):
+        "Ensure that presets with the same Conan inputs, configured in parallel, install only once"
+        source_dir, _ = basic_cmake_project
+        presets = {"version": 3, "configurePresets": [
+            {"name": name, "binaryDir": f"${{sourceDir}}/build-{name}", "cacheVariables": {"CMAKE_BUILD_TYPE": build_type}}
+            for name, build_type in [("release-a", "Release"), ("release-b", "Release"), ("debug", "Debug")]]}
+        (source_dir / "CMakePresets.json").write_text(json.dumps(presets))
+        shared_cache = tmp_path / "shared_cache"
+        run(f"python {src_dir / 'conan_configure_presets.py'} --source-dir {source_dir} --jobs 2 --shared-cache {shared_cache}")
+        out, _ = capfd.readouterr()
+        assert all(f"===== {name}: done =====" in out for name in ["release-a", "release-b", "debug"])
+        assert out.count("Installing single configuration Release") == 1
+        assert out.count("Installing single configuration Debug") == 1
+        assert len([p for p in shared_cache.iterdir() if p.is_dir()]) == 2
+        # The installs are only serialized with those of the same profiles, which build the same binaries
+        assert len(list(shared_cache.glob("conan_cache_*.lock"))) == 2
+        run(f"cmake --build {source_dir / 'build-release-b'}")
+
+
+class TestPrewarm:
+    def test_prewarm_script_mode(self, capfd, basic_cmake_project):
+        "Ensure that the dependencies installed in script mode are reused by the configure of the project"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -DCONAN_PREWARM_SOURCE_DIR={source_dir} -DCONAN_PREWARM_BINARY_DIR={binary_dir} -DCONAN_PREWARM_LANGUAGES=CXX "
+            f"-DCMAKE_BUILD_TYPE=Release -DCMAKE_CXX_STANDARD=17 -P {conan_provider}")
+        out, _ = capfd.readouterr()
+        assert "Installing single configuration Release" in out
+        assert (binary_dir / "conan" / "conan_install_stamp.json").exists()
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "inputs unchanged since last 'conan install', reusing" in out
+        assert "Installing single configuration" not in out
+        run(f"cmake --build {binary_dir}")
+
+    def test_prewarm_other_generator(self, capfd, basic_cmake_project):
+        "Ensure that a warning is printed when the project is configured with another generator than the prewarm"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -DCONAN_PREWARM_SOURCE_DIR={source_dir} -DCONAN_PREWARM_BINARY_DIR={binary_dir} -DCONAN_PREWARM_LANGUAGES=CXX "
+            f"-DCONAN_PREWARM_GENERATOR=Ninja -DCMAKE_BUILD_TYPE=Release -DCMAKE_CXX_STANDARD=17 -P {conan_provider}")
+        out, err = capfd.readouterr()
+        assert "Installing single configuration Release" in out
+        assert "prewarmed with the generator" not in err
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -G 'Ninja Multi-Config'")
+        out, err = capfd.readouterr()
+        assert "the dependencies were prewarmed with the generator 'Ninja'" in " ".join(err.split())
+        assert "Installing configurations Release;Debug" in out
+
+
+class TestPrefetch:
+    def test_prefetch(self, capfd, basic_cmake_project):
+        "The graph is resolved in the background at include time, and the install waits for it"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            "-DCONAN_PROVIDER_PREFETCH=ON")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: prefetching the dependencies of" in out
+        assert out.index("CMake-Conan: prefetching") < out.index("The CXX compiler identification")
+        prefetch_folder = binary_dir / "conan_prefetch"
+        assert (prefetch_folder / "conan_prefetch_done").read_text() == "0"
+        graph = json.loads((prefetch_folder / "conan_prefetch_graph.json").read_text())
+        assert any(node["ref"].startswith("hello/0.1") for node in graph["graph"]["nodes"].values())
+        assert "-- Generating done" in out
+
+        # Nothing is prefetched again until the conanfile changes
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: prefetching" not in out
+
+        with open(source_dir / "conanfile.txt", "a") as conanfile:
+            conanfile.write("\n# comment\n")
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: prefetching" in out
+        run(f"cmake --build {binary_dir}")
+
+    @unix
+    def test_prefetch_old_conan(self, capfd, basic_cmake_project, tmp_path):
+        "Nothing is prefetched with Conan older than 2.2.0"
+        source_dir, binary_dir = basic_cmake_project
+        wrapper = tmp_path / "conan"
+        wrapper.write_text('#!/bin/sh\nif [ "$1" = "--version" ]; then echo "Conan version 2.1.0"; exit 0; fi\nexec conan "$@"\n')
+        wrapper.chmod(0o755)
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            f"-DCONAN_COMMAND={wrapper} -DCONAN_PROVIDER_PREFETCH=ON")
+        out, _ = capfd.readouterr()
+        assert "CONAN_PROVIDER_PREFETCH requires Conan 2.2.0 or later" in out
+        assert "CMake-Conan: prefetching" not in out
+        assert not (binary_dir / "conan_prefetch").exists()
+        assert "-- Generating done" in out
+
+
+class TestLockfile:
+    def test_lockfile_created_and_used(self, capfd, basic_cmake_project):
+        "Ensure that the lockfile is created on request, and then used for the following installs"
+        source_dir, binary_dir = basic_cmake_project
+        lockfile = source_dir / "conan.lock"
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_LOCKFILE_UPDATE=ON")
+        out, _ = capfd.readouterr()
+        assert f"--lockfile-out={lockfile}" in out
+        assert "hello/0.1" in lockfile.read_text()
+
+        shutil.rmtree(binary_dir / "conan")
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCONAN_LOCKFILE_UPDATE=OFF")
+        out, _ = capfd.readouterr()
+        assert f"--lockfile={lockfile}" in out
+        assert "--lockfile-partial" not in out
+        assert "--lockfile-out" not in out
+
+    def test_lockfile_missing(self, capfd, basic_cmake_project):
+        "Ensure that a lockfile given explicitly must exist"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_LOCKFILE=missing.lock", check=False, cwd=binary_dir)
+        _, err = capfd.readouterr()
+        # CMake wraps the message depending on the length of the path
+        assert f"{binary_dir.as_posix()}/missing.lock does not exist" in " ".join(err.split())
+
+    def test_lockfile_partial(self, capfd, basic_cmake_project):
+        "Ensure that requirements missing from the lockfile are only accepted in partial mode"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"conan lock create {source_dir} --lockfile-out={binary_dir}/deps.lock")
+        with open(source_dir / "conanfile.txt", "a") as f:
+            f.write("\n[test_requires]\ncmake-module-only/0.1\n")
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_LOCKFILE={binary_dir}/deps.lock", check=False)
+        _, err = capfd.readouterr()
+        assert "not in lockfile" in err
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCONAN_LOCKFILE_PARTIAL=ON")
+        out, _ = capfd.readouterr()
+        assert "--lockfile-partial" in out
+
+    @pytest.mark.parametrize("lockfile_args", ["--lockfile;deps.lock", "--lockfile=deps.lock"])
+    def test_lockfile_install_args(self, capfd, basic_cmake_project, lockfile_args):
+        "Ensure that a lockfile in CONAN_INSTALL_ARGS is found from the build folder, and its changes are detected"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"conan lock create {source_dir} --lockfile-out={binary_dir}/deps.lock")
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_INSTALL_ARGS="{lockfile_args}"')
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Installing single configuration Release" in out
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "inputs unchanged since last 'conan install', reusing" in out
+
+        with open(binary_dir / "deps.lock", "a") as lockfile:
+            lockfile.write("\n")
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Installing single configuration Release" in out
+
+
+class TestOffline:
+    def test_offline_auto_cache_hit(self, capfd, basic_cmake_project):
+        "Ensure that remotes are not used when all the packages are in the cache"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        shutil.rmtree(binary_dir / "conan")
+        capfd.readouterr()
+
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCONAN_PROVIDER_OFFLINE=AUTO")
+        out, _ = capfd.readouterr()
+        assert "--no-remote" in out
+        assert "--build=missing" not in out
+        assert "all packages found in the Conan cache, remotes were not used" in out
+        run(f"cmake --build {binary_dir}")
+
+    def test_offline_auto_fallback(self, capfd, basic_cmake_project):
+        "Ensure that packages missing from the cache are installed with the remotes"
+        source_dir, binary_dir = basic_cmake_project
+        conan_install_args = '"--build=missing;-s;bye/*:build_type=MinSizeRel"'
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_OFFLINE=AUTO -DCONAN_INSTALL_ARGS={conan_install_args}")
+        out, err = capfd.readouterr()
+        assert "Missing prebuilt package for 'bye/0.1'" in err
+        assert "packages missing from the Conan cache, installing with remotes" in out
+        run(f"cmake --build {binary_dir}")
+
+    def test_offline_auto_parallel_failure(self, capfd, basic_cmake_project):
+        "Ensure that failures other than packages missing from the cache are not tried again with the remotes"
+        source_dir, binary_dir = basic_cmake_project
+        generator = "-G'Ninja Multi-Config'" if platform.system() != "Windows" else ""
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} {generator} '
+            '-DCONAN_PROVIDER_OFFLINE=AUTO -DCONAN_INSTALL_PARALLEL=ON -DCONAN_INSTALL_CONFIGURATIONS="Release;Unknown"', check=False)
+        out, err = capfd.readouterr()
+        assert "all packages for Release found in the Conan cache" in out
+        assert "trying again with remotes" not in out
+        assert "Unknown: exit code 1" in err
+
+    def test_offline_on(self, capfd, basic_cmake_project):
+        "Ensure that remotes are never used, and that binaries can still be built, in offline mode"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_OFFLINE=ON")
+        out, _ = capfd.readouterr()
+        assert "--no-remote" in out and "--build=missing" in out
+        assert "installing with remotes" not in out
+
+
+class TestConanExecutable:
+    @pytest.fixture
+    def conan_wrapper(self, tmp_path):
+        "A Conan executable that logs its invocations"
+        log = tmp_path / "conan_invocations.log"
+        wrapper = tmp_path / "conan"
+        wrapper.write_text(f'#!/bin/sh\necho "$@" >> {log.as_posix()}\nexec conan "$@"\n')
+        wrapper.chmod(0o755)
+        yield wrapper, log
+
+    @unix
+    def test_version_probed_once(self, capfd, basic_cmake_project, conan_wrapper):
+        "The Conan version is only probed again when the executable changes"
+        source_dir, binary_dir = basic_cmake_project
+        wrapper, log = conan_wrapper
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release -DCONAN_COMMAND={wrapper}")
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        assert log.read_text().count("--version") == 1
+        wrapper.write_text(wrapper.read_text() + "\n")
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        assert log.read_text().count("--version") == 2
+
+    @unix
+    def test_skip_version_check(self, capfd, basic_cmake_project, conan_wrapper):
+        "The version check can be skipped altogether"
+        source_dir, binary_dir = basic_cmake_project
+        wrapper, log = conan_wrapper
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            f"-DCONAN_COMMAND={wrapper} -DCONAN_SKIP_VERSION_CHECK=ON")
+        out, _ = capfd.readouterr()
+        assert all(expected in out for expected in expected_conan_install_outputs)
+        assert "--version" not in log.read_text()
+
+    @unix
+    def test_single_process(self, capfd, basic_cmake_project, conan_wrapper, conan_home_dir):
+        "The version check, the default profile detection and the installs run in a single Conan process"
+        source_dir, binary_dir = basic_cmake_project
+        wrapper, log = conan_wrapper
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            f"-DCONAN_COMMAND={wrapper} -DCONAN_PROVIDER_SINGLE_PROCESS=ON")
+        out, _ = capfd.readouterr()
+        assert all(expected in out for expected in expected_conan_install_outputs)
+        assert "Installing dependencies in a single Conan process" in out
+        assert (conan_home_dir / "extensions" / "commands" / "cmd_cmake_conan.py").exists()
+        assert (binary_dir / "conan" / "conan_install_Release.json").exists()
+        # The version is probed first, as the command requires Conan 2.2.0 or later
+        invocations = log.read_text().splitlines()
+        assert len(invocations) == 2 and invocations[0] == "--version" and invocations[1].startswith("cmake-conan ")
+
+        # The version is cached, and the install is reused
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "inputs unchanged since last 'conan install', reusing" in out
+        assert len(log.read_text().splitlines()) == 2
+
+        run(f"cmake --build {binary_dir}")
+        run(os.path.join(binary_dir, "app"))
+        out, _ = capfd.readouterr()
+        assert all(expected in out for expected in [f.format(config="Release") for f in expected_app_outputs])
+
+    @unix
+    def test_single_process_old_conan(self, capfd, basic_cmake_project, tmp_path):
+        "With Conan older than 2.2.0, the steps run as separate Conan invocations"
+        source_dir, binary_dir = basic_cmake_project
+        wrapper = tmp_path / "conan"
+        wrapper.write_text('#!/bin/sh\nif [ "$1" = "--version" ]; then echo "Conan version 2.1.0"; exit 0; fi\nexec conan "$@"\n')
+        wrapper.chmod(0o755)
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            f"-DCONAN_COMMAND={wrapper} -DCONAN_PROVIDER_SINGLE_PROCESS=ON")
+        out, _ = capfd.readouterr()
+        assert "CONAN_PROVIDER_SINGLE_PROCESS requires Conan 2.2.0 or later" in out
+        assert "Installing dependencies in a single Conan process" not in out
+        assert "CMake-Conan: Installing single configuration Release" in out
+
+
+class TestTimings:
+    def test_timings_report(self, capfd, basic_cmake_project):
+        "The time spent in each phase of the provider is written to a JSON file, and optionally summarized"
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release "
+            "-DCONAN_PROVIDER_TIMING_SUMMARY=ON")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Timings" in out
+        timings = json.loads((binary_dir / "conan_provider_timings.json").read_text())
+        phases = [phase["name"] for phase in timings["phases"]]
+        for expected in ["conan_version_check", "conan_profile_detect_default", "detect_host_profile", "detect_compiler",
+                         "conan_install(Release)", "conan_parse_install_output",
+                         "find_package(hello)", "find_package(bye)"]:
+            assert expected in phases
+        if platform.system() == "Linux":
+            assert "check_cxx_source_compiles(_CONAN_IS_GNU_LIBSTDCXX)" in phases
+        assert all(phase["duration_us"] >= 0 for phase in timings["phases"])
+
+
 class TestSubdir:
     @pytest.fixture(scope="class", autouse=True)
     def subdir_setup(self, tmp_path_factory):
@@ -395,14 +1034,9 @@ class TestSubdir:
         source_dir, binary_dir = setup_cmake_workdir(workdir, ["basic_cmake", "subdir"])
         TestSubdir.source_dir = source_dir
         TestSubdir.binary_dir = binary_dir
-        cwd = os.getcwd()
         subdir_recipe = tmp_path_factory.mktemp("subdir_recipe")
-        os.chdir(subdir_recipe.as_posix())
-        run("conan new cmake_lib -d name=subdir -d version=0.1 -f -vquiet")
-        run("conan export . -vquiet")
-        os.chdir(binary_dir.as_posix())
-        yield
-        os.chdir(cwd)
+        run("conan new cmake_lib -d name=subdir -d version=0.1 -f -vquiet", cwd=subdir_recipe)
+        run("conan export . -vquiet", cwd=subdir_recipe)
 
     def test_add_subdirectory(self, capfd):
         "The CMAKE_PREFIX_PATH is set for CMakeLists.txt included with add_subdirectory BEFORE the first find_package."
@@ -410,7 +1044,7 @@ class TestSubdir:
         run(f"cmake -S {self.source_dir} -B {self.binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
         out, _ = capfd.readouterr()
         assert all(expected in out for expected in expected_conan_install_outputs)
-        run("cmake --build . --config Release")
+        run(f"cmake --build {self.binary_dir} --config Release")
         if platform.system() == "Windows":
             app_executable = self.binary_dir / "subdir" / "Release" / "appSubdir.exe"
         else:
@@ -419,6 +1053,28 @@ class TestSubdir:
         out, _ = capfd.readouterr()
         assert "subdir/0.1: Hello World Release!" in out
 
+    def test_per_directory_install(self, capfd, tmp_path):
+        "With CONAN_PROVIDER_PER_DIRECTORY, the conanfile of a subdirectory is installed into its own build folder"
+        source_dir, binary_dir = setup_cmake_workdir(tmp_path, ["basic_cmake", "subdir"])
+        (source_dir / "conanfile.txt").write_text("[requires]\nhello/0.1\nbye/0.1\n")
+        (source_dir / "subdir" / "conanfile.txt").write_text("[requires]\nsubdir/0.1\n")
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} "
+            "-DCMAKE_BUILD_TYPE=Release -DCONAN_PROVIDER_PER_DIRECTORY=ON")
+        out, _ = capfd.readouterr()
+        assert (binary_dir / "subdir" / "conan" / "conan_install_stamp.json").exists()
+        assert (binary_dir / "conan" / "conan_install_stamp.json").exists()
+        # The packages indexed for a directory are only those of its own install
+        subdir_index = (binary_dir / "subdir" / "conan" / "conan_find_package_index.cmake").read_text()
+        index = (binary_dir / "conan" / "conan_find_package_index.cmake").read_text()
+        assert "CONAN_FIND_PACKAGE_CONFIG_subdir|" in subdir_index and "CONAN_FIND_PACKAGE_CONFIG_hello|" not in subdir_index
+        assert "CONAN_FIND_PACKAGE_CONFIG_hello|" in index and "CONAN_FIND_PACKAGE_CONFIG_subdir|" not in index
+        run(f"cmake --build {binary_dir} --config Release")
+
+        # Each directory reuses its own install on reconfigure
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert out.count("inputs unchanged since last 'conan install'") == 2
+
 class TestLibcxx:
     @darwin
     def test_libcxx_macos(self, capfd, basic_cmake_project):
@@ -468,6 +1124,27 @@ class TestLibcxx:
         assert "Performing Test _CONAN_IS_LIBCXX - Success" in out
         assert "compiler.libcxx=libc++" in out
 
+    @linux
+    def test_detection_reused_until_flags_change(self, capfd, basic_cmake_project):
+        """Settings detected in a previous run are reused, and detected again when the flags change"""
+        source_dir, binary_dir = basic_cmake_project
+        run(f"cmake -S {source_dir} -B {binary_dir} -DCMAKE_PROJECT_TOP_LEVEL_INCLUDES={conan_provider} -DCMAKE_BUILD_TYPE=Release")
+        out, _ = capfd.readouterr()
+        assert "Performing Test _CONAN_IS_GNU_LIBSTDCXX - Success" in out
+        assert "compiler.libcxx=libstdc++11" in out
+
+        run(f"cmake -S {source_dir} -B {binary_dir}")
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Reusing settings detected in a previous run" in out
+        assert "Performing Test _CONAN_IS_GNU_LIBSTDCXX" not in out
+        assert "compiler.libcxx=libstdc++11" in out
+
+        run(f'cmake -S {source_dir} -B {binary_dir} -DCMAKE_CXX_FLAGS="-D_GLIBCXX_USE_CXX11_ABI=0"')
+        out, _ = capfd.readouterr()
+        assert "CMake-Conan: Reusing settings detected in a previous run" not in out
+        assert "Performing Test _CONAN_GNU_LIBSTDCXX_IS_CXX11_ABI - Failed" in out
+        assert "compiler.libcxx=libstdc++\n" in out
+
 class TestOsVersion:
     @darwin
     def test_os_version(self, capfd, basic_cmake_project):